@@ -0,0 +1,56 @@
+from .cache import PACK_ALGORITHM, PackingCache, layout_key
+from .color import CmykConverter
+from .engine import (
+    DEFAULT_DPI,
+    DEFAULT_PORTFOLIO_TIME_BUDGET,
+    LAYOUT_MODES,
+    OUTPUT_PROFILES,
+    PACK_PORTFOLIO,
+    PAPER_RATIOS,
+    PAPER_SIZES_MM,
+    TRACE_SUFFIX,
+    CanvasSearch,
+    CollageJob,
+    Layout,
+    LayoutError,
+    branding_layers,
+    branding_overlay,
+    compute_layout,
+    encode_collage,
+    find_free_spaces,
+    find_min_canvas,
+    fit_sizes_to_sheet,
+    image_to_base64,
+    largest_free_rect,
+    output_base,
+    output_profile,
+    pack_rects,
+    pack_sheets,
+    padded_rects,
+    parse_ratio,
+    parse_strategy,
+    render_banded,
+    render_collage,
+    render_preview,
+    render_sheets,
+    render_sheets_preview,
+    render_to_file,
+    run_job,
+    scaled_sizes,
+    sheet_size,
+    write_tiff,
+)
+from .grid import GRID_STRATEGY, best_grid_columns, grid_layout
+from .incremental import INCREMENTAL_SUFFIX, REPACK_SLACK_PCT, match_photos, update_layout
+from .jobs import BackgroundWriter, JobCancelled, LayoutJob, LayoutJobRunner
+from .optimize import (
+    DEFAULT_OPTIMIZE_SECONDS,
+    AnnealResult,
+    anneal,
+    optimize_layout,
+    pack_in_order,
+)
+from .photos import PhotoInfo, load_photo, read_photo_info
+from .tiff import StripTiffWriter
+from .trace import RunTrace, current_trace, traced
+from .thumbnails import ProxyCache, ThumbnailCache, make_thumbnail
@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .batch import find_job_files, init_worker, run_job_file
+from .grid import GRID_STRATEGY
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m collage",
+        description="Render every *.json collage job in a directory without the UI.",
+    )
+    parser.add_argument("jobs_dir", help="directory containing job description files")
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of jobs rendered in parallel (default: all cores)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory for packings shared between runs; jobs with the same photo sizes, "
+        "padding and ratio skip the canvas search",
+    )
+    args = parser.parse_args(argv)
+
+    job_files = find_job_files(args.jobs_dir)
+    if not job_files:
+        print(f"No job files found in '{args.jobs_dir}'.", file=sys.stderr)
+        return 1
+
+    failures = 0
+    # No more processes than jobs; with several jobs in flight the cores are already busy
+    workers = max(1, min(args.workers, len(job_files)))
+    exclusive = workers == 1
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(args.cache_dir,)
+    ) as pool:
+        futures = {pool.submit(run_job_file, path, exclusive): path for path in job_files}
+        for future in as_completed(futures):
+            name = os.path.basename(futures[future])
+            try:
+                result = future.result()
+            except Exception as ex:
+                failures += 1
+                print(f"FAILED {name}: {ex}", file=sys.stderr)
+                continue
+            if "sheets" in result:
+                sheets = result["sheets"]
+                print(
+                    f"{name}: {len(sheets)} {result['paper']} sheets at {result['dpi']} DPI "
+                    f"({os.path.basename(result['outputs'][0])} ...), "
+                    f"last sheet unused {sheets[-1]['unused_pct']:.2f}%, "
+                    f"{sheets[0]['strategy']}, {result['seconds']:.2f}s, "
+                    f"{result['output_format']} encoded in {result['encode_seconds']:.2f}s"
+                )
+                continue
+            layout = result["layout"]
+            if layout["cached"]:
+                search = "cached packing"
+            elif layout["strategy"].startswith(GRID_STRATEGY):
+                search = "no packing"
+            else:
+                search = f"{layout['pack_attempts']} pack attempts"
+            print(
+                f"{name}: {result['output']} "
+                f"({layout['canvas_width']}x{layout['canvas_height']}, "
+                f"unused {layout['unused_pct']:.2f}%, {layout['strategy']}, "
+                f"{search}, {result['seconds']:.2f}s, "
+                f"{result['output_format']} encoded in {result['encode_seconds']:.2f}s)"
+            )
+
+    print(
+        f"Rendered {len(job_files) - failures}/{len(job_files)} jobs "
+        f"in {time.perf_counter() - started:.2f}s."
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
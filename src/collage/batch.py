@@ -0,0 +1,48 @@
+import glob
+import json
+import os
+import time
+
+from .cache import PackingCache
+from .engine import TRACE_SUFFIX, CollageJob, output_base, run_job
+
+LAYOUT_SUFFIX = ".layout.json"
+
+# Packing cache of the current worker process
+_cache = None
+
+
+# ProcessPoolExecutor initializer of the batch runner and the HTTP service
+def init_worker(cache_dir):
+    global _cache
+    _cache = PackingCache(directory=cache_dir)
+
+
+def run_job_file(path, exclusive=True):
+    return run_batch_job(CollageJob.load(path), exclusive)
+
+
+# Run one job and write its layout JSON next to the rendered collage.
+# Jobs that share the machine with other jobs search serially and render on a single
+# thread unless their job file asks for more.
+def run_batch_job(job, exclusive=True):
+    started = time.perf_counter()
+    if not exclusive:
+        job.parallel_search = False
+        job.render_workers = job.render_workers or 1
+    result = run_job(job, cache=_cache)
+    layout_path = output_base(result) + LAYOUT_SUFFIX
+    with open(layout_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    result["layout_file"] = layout_path
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+# Job files in jobs_dir; the layout JSON and trace files written beside them are skipped
+def find_job_files(jobs_dir):
+    return sorted(
+        p
+        for p in glob.glob(os.path.join(jobs_dir, "*.json"))
+        if not p.endswith((LAYOUT_SUFFIX, TRACE_SUFFIX))
+    )
@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from importlib import metadata
+
+from PIL import Image, ImageDraw
+
+from .engine import (
+    PAPER_RATIOS,
+    branding_overlay,
+    compute_layout,
+    encode_collage,
+    find_free_spaces,
+    output_profile,
+    pack_rects,
+    padded_rects,
+    render_collage,
+)
+from .photos import read_photo_info
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_VERSION = 1
+
+# Aspect ratio mixes of the synthetic photo sets: (long side, short side, weight)
+ASPECT_MIXES = {
+    "camera": [(3, 2, 0.55), (4, 3, 0.3), (16, 9, 0.1), (1, 1, 0.05)],
+    "square": [(1, 1, 1.0)],
+    "mixed": [(3, 2, 0.3), (4, 3, 0.2), (16, 9, 0.2), (1, 1, 0.15), (3, 1, 0.05), (5, 4, 0.1)],
+}
+# Share of the non-square photos that are portrait
+PORTRAIT_SHARE = 0.4
+LONG_SIDE_RANGE = (120, 480)
+
+DEFAULT_COUNTS = (10, 50, 200)
+# The search grows much faster than linearly; 1000 and 2000 photos take minutes per run
+FULL_COUNTS = (10, 50, 200, 500, 1000, 2000)
+DEFAULT_MIXES = ("camera", "mixed")
+DEFAULT_PADDINGS = (0, 10)
+DEFAULT_MAX_RENDER_PIXELS = 150_000_000
+STAGES = ("search", "final_pack", "free_space", "composite", "branding", "encode")
+
+
+# Photo sizes of a synthetic set; the same (count, mix, seed) always gives the same sizes
+def synthetic_sizes(count, mix, seed=0, long_side=LONG_SIDE_RANGE):
+    rng = random.Random(f"{mix}-{count}-{seed}")
+    aspects = ASPECT_MIXES[mix]
+    sizes = []
+    for _ in range(count):
+        long_part, short_part, _ = rng.choices(aspects, weights=[a[2] for a in aspects])[0]
+        long_px = rng.randint(*long_side)
+        short_px = max(1, round(long_px * short_part / long_part))
+        portrait = long_part != short_part and rng.random() < PORTRAIT_SHARE
+        sizes.append((short_px, long_px) if portrait else (long_px, short_px))
+    return sizes
+
+
+# Write the photos of a synthetic set as JPEGs into directory, reusing files that are
+# already there. Each photo is a flat colour with a diagonal, cheap to encode and decode.
+def make_corpus(directory, count, mix, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i, (w, h) in enumerate(synthetic_sizes(count, mix, seed)):
+        path = os.path.join(directory, f"{mix}_{seed}_{count}_{i:04d}_{w}x{h}.jpg")
+        colour = tuple(rng.randrange(40, 220) for _ in range(3))
+        if not os.path.exists(path):
+            img = Image.new("RGB", (w, h), colour)
+            ImageDraw.Draw(img).line((0, 0, w, h), fill=(255, 255, 255), width=3)
+            img.save(path, quality=85)
+        paths.append(path)
+    return paths
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024**2 if sys.platform == "darwin" else 1024), 1)
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+# Run one scenario repeat times and keep the fastest time of every stage. Compositing,
+# branding and encoding are skipped (None) for canvases above max_render_pixels.
+def run_scenario(scenario, corpus_dir, repeat=1, max_render_pixels=DEFAULT_MAX_RENDER_PIXELS):
+    paths = make_corpus(corpus_dir, scenario["count"], scenario["mix"], scenario["seed"])
+    photos = [read_photo_info(path) for path in paths]
+    sizes = [photo.size for photo in photos]
+    ratio = PAPER_RATIOS[scenario["ratio"]]
+    padding = scenario["padding"]
+    profile = output_profile(scenario["output_format"])
+    seconds = {stage: None for stage in STAGES}
+
+    def record(stage, value):
+        if seconds[stage] is None or value < seconds[stage]:
+            seconds[stage] = round(value, 4)
+
+    for _ in range(repeat):
+        layout, elapsed = _timed(
+            compute_layout, sizes, padding, ratio, parallel=scenario["parallel"]
+        )
+        record("search", elapsed)
+        rects = padded_rects(layout.sizes, padding)
+        _, elapsed = _timed(
+            pack_rects, rects, layout.canvas_width, layout.canvas_height, layout.strategy
+        )
+        record("final_pack", elapsed)
+        spaces, elapsed = _timed(
+            find_free_spaces, layout.canvas_width, layout.canvas_height, layout.rects
+        )
+        record("free_space", elapsed)
+        if layout.canvas_area > max_render_pixels:
+            continue
+
+        canvas, elapsed = _timed(render_collage, layout, photos)
+        record("composite", elapsed)
+        started = time.perf_counter()
+        panel, origin, _ = branding_overlay(layout, "RGB", text="Benchmark Print Shop")
+        if panel is not None:
+            canvas.paste(panel, origin)
+        record("branding", time.perf_counter() - started)
+        with tempfile.TemporaryDirectory() as out_dir:
+            output_path = os.path.join(out_dir, f"benchmark.{profile['extension']}")
+            record("encode", encode_collage(canvas, output_path, profile))
+            output_bytes = os.path.getsize(output_path)
+        canvas.close()
+
+    result = dict(scenario)
+    result.update(
+        {
+            "canvas": [layout.canvas_width, layout.canvas_height],
+            "canvas_pixels": layout.canvas_area,
+            "unused_pct": round(layout.unused_pct, 4),
+            "pack_attempts": layout.pack_attempts,
+            "strategy": layout.strategy,
+            "free_spaces": len(spaces),
+            "output_bytes": output_bytes if seconds["encode"] is not None else None,
+            "seconds": seconds,
+            "total_seconds": round(sum(s for s in seconds.values() if s is not None), 4),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+    )
+    return result
+
+
+def scenario_name(scenario):
+    return f"{scenario['mix']}-n{scenario['count']}-p{scenario['padding']}"
+
+
+def _environment():
+    packages = {}
+    for name in ("Pillow", "numpy", "rectangle-packer"):
+        try:
+            packages[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            packages[name] = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": packages,
+    }
+
+
+# Stages that got slower than the baseline by more than tolerance (a fraction), as
+# (scenario, stage, baseline seconds, new seconds). Stages under min_seconds are noise.
+def compare(results, baseline, tolerance=0.2, min_seconds=0.05):
+    previous = {run["name"]: run for run in baseline["scenarios"]}
+    regressions = []
+    for run in results["scenarios"]:
+        old = previous.get(run["name"])
+        if old is None:
+            continue
+        for stage in STAGES:
+            before, after = old["seconds"].get(stage), run["seconds"].get(stage)
+            if before is None or after is None or max(before, after) < min_seconds:
+                continue
+            if after > before * (1 + tolerance):
+                regressions.append((run["name"], stage, before, after))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m collage.benchmark",
+        description="Time the packing and rendering pipeline on synthetic photo sets.",
+    )
+    parser.add_argument("--counts", type=int, nargs="+", help="photo counts per set")
+    parser.add_argument(
+        "--full", action="store_true", help=f"use the counts {', '.join(map(str, FULL_COUNTS))}"
+    )
+    parser.add_argument("--mixes", nargs="+", choices=sorted(ASPECT_MIXES), default=DEFAULT_MIXES)
+    parser.add_argument("--paddings", type=int, nargs="+", default=DEFAULT_PADDINGS)
+    parser.add_argument("--ratio", choices=sorted(PAPER_RATIOS), default="A Series")
+    parser.add_argument("--format", default="png-fast", help="output format for the encode stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per set; the fastest counts")
+    parser.add_argument(
+        "--parallel", action="store_true", help="let large sets search on a process pool"
+    )
+    parser.add_argument(
+        "--max-render-pixels",
+        type=int,
+        default=DEFAULT_MAX_RENDER_PIXELS,
+        help="skip compositing, branding and encoding above this canvas size",
+    )
+    parser.add_argument(
+        "--corpus-dir",
+        default=os.path.join(tempfile.gettempdir(), "collage-benchmark-corpus"),
+        help="where the synthetic photos are written and reused from",
+    )
+    parser.add_argument("-o", "--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="slowdown against the baseline that counts as a regression (default: 0.2)",
+    )
+    args = parser.parse_args(argv)
+
+    counts = args.counts or (FULL_COUNTS if args.full else DEFAULT_COUNTS)
+    scenarios = [
+        {
+            "count": count,
+            "mix": mix,
+            "padding": padding,
+            "ratio": args.ratio,
+            "seed": args.seed,
+            "output_format": args.format,
+            "parallel": args.parallel,
+        }
+        for mix in args.mixes
+        for count in counts
+        for padding in args.paddings
+    ]
+    results = {
+        "version": RESULTS_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": _environment(),
+        "scenarios": [],
+    }
+    for scenario in scenarios:
+        scenario["name"] = scenario_name(scenario)
+        # A fresh process per set, so peak memory belongs to that set alone
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            run = pool.submit(
+                run_scenario, scenario, args.corpus_dir, args.repeat, args.max_render_pixels
+            ).result()
+        results["scenarios"].append(run)
+        stages = ", ".join(
+            f"{stage} {seconds:.3f}s"
+            for stage, seconds in run["seconds"].items()
+            if seconds is not None
+        )
+        print(
+            f"{run['name']}: {run['canvas'][0]}x{run['canvas'][1]}, "
+            f"unused {run['unused_pct']:.2f}%, {stages}, peak {run['peak_rss_mb']} MB",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, stage, before, after in regressions:
+            print(
+                f"REGRESSION {name} {stage}: {before:.3f}s -> {after:.3f}s "
+                f"({(after / before - 1) * 100:+.0f}%)",
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+        print("No regressions against the baseline.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
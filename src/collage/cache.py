@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+# Default rectpack algorithm/sort used by pack_rects. The strategies searched are part
+# of every cache key.
+PACK_ALGORITHM = "MaxRectsBssf/SORT_AREA"
+
+
+def layout_key(sizes, padding, ratio, algorithm=PACK_ALGORITHM):
+    # Only the inputs that change the packing; watermark, logo or output settings do not
+    return (tuple(tuple(size) for size in sizes), padding, round(ratio, 9), algorithm)
+
+
+# LRU cache of finished packings with an optional directory of JSON files behind it
+class PackingCache:
+    def __init__(self, max_entries=32, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _file_for(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        elif self.directory:
+            entry = self._read(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self._remember(key, entry)
+        if self.directory:
+            self._write(key, entry)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # A file that cannot be read or is not a packing (e.g. written by an older version)
+    # counts as a miss
+    def _read(self, key):
+        try:
+            with open(self._file_for(key), encoding="utf-8") as f:
+                entry = json.load(f)
+            entry["rects"] = [tuple(rect) for rect in entry["rects"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return entry
+
+    def _write(self, key, entry):
+        # Write to a temporary file first so concurrent batch workers never see half a file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._file_for(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,49 @@
+import functools
+import os
+
+from PIL import ImageCms
+
+DEFAULT_INTENT = ImageCms.Intent.PERCEPTUAL
+K_BLACK = (0, 0, 0, 255)
+
+
+@functools.lru_cache(maxsize=8)
+def _cmyk_transform(profile_path, modified, intent):
+    # modified (the profile's mtime) is only part of the key, so an edited profile is reloaded
+    return ImageCms.buildTransform(
+        ImageCms.createProfile("sRGB"), profile_path, "RGB", "CMYK", renderingIntent=intent
+    )
+
+
+# Converts composed RGB images (a whole canvas or one band of it) to CMYK. With an ICC
+# output profile the conversion goes through a cached littleCMS transform and the profile
+# is embedded in the output; without one Pillow's plain RGB -> CMYK formula is used.
+# black_text is an optional (mask, (x, y)) of black text in canvas coordinates that is
+# inked on K alone over every converted image; top is the image's first canvas row.
+class CmykConverter:
+    def __init__(self, profile_path=None, intent=DEFAULT_INTENT, black_text=None):
+        self.profile_path = profile_path
+        self.black_text = black_text
+        self.transform = None
+        self.icc_profile = None
+        if profile_path:
+            self.transform = _cmyk_transform(
+                profile_path, os.path.getmtime(profile_path), intent
+            )
+            with open(profile_path, "rb") as f:
+                self.icc_profile = f.read()
+
+    def __call__(self, image, top=0):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        if self.transform is None:
+            converted = image.convert("CMYK")
+        else:
+            converted = ImageCms.applyTransform(image, self.transform)
+        if self.black_text is not None:
+            mask, (x, y) = self.black_text
+            first, last = max(y, top), min(y + mask.height, top + image.height)
+            if first < last:
+                rows = mask.crop((0, first - y, mask.width, last - y))
+                converted.paste(K_BLACK, (x, first - top), rows)
+        return converted
@@ -0,0 +1,1470 @@
+import base64
+import functools
+import io
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import rectpack
+from PIL import Image, ImageCms, ImageDraw, ImageFont
+from rectpack import PackingBin, PackingMode, newPacker
+
+from .cache import PACK_ALGORITHM, layout_key
+from .color import CmykConverter
+from .photos import load_photo, read_photo_info
+from .tiff import StripTiffWriter
+from .trace import RunTrace, submit_traced, trace_add, trace_values, traced
+
+# Paper proportions as height / width
+PAPER_RATIOS = {
+    "A Series": math.sqrt(2),
+    "B Series": 1.0 / math.sqrt(2),
+    "C Series": 1.0 / math.sqrt(2),
+    "Letter": 11.0 / 8.5,
+}
+
+# Fixed paper sizes in millimetres (width, height) for printing onto whole sheets
+PAPER_SIZES_MM = {
+    "A5": (148, 210),
+    "A4": (210, 297),
+    "A3": (297, 420),
+    "Letter": (215.9, 279.4),
+    "Legal": (215.9, 355.6),
+}
+DEFAULT_DPI = 300
+# rectpack bin selection heuristics tried when packing onto sheets; the fewest sheets wins
+SHEET_BIN_ALGORITHMS = ("BFF", "BBF", "Global")
+# "pack" searches for the smallest canvas of the paper ratio; "grid" lays a uniform grid
+# on a fixed sheet (collage.grid), much faster but leaving more of the sheet empty
+LAYOUT_MODES = ("pack", "grid")
+
+TRACE_SUFFIX = ".trace.json"
+
+# Below this many photos a process pool costs more to start than the searches take
+PARALLEL_SEARCH_MIN_PHOTOS = 40
+
+# Strategies tried in portfolio mode, default first. No single one wins on every photo set;
+# each of these gave the smallest canvas on some of our sample sets.
+PACK_PORTFOLIO = (
+    PACK_ALGORITHM,
+    "MaxRectsBlsf/SORT_AREA",
+    "MaxRectsBaf/SORT_AREA",
+    "MaxRectsBssf/SORT_PERI",
+    "MaxRectsBssf/SORT_LSIDE",
+    "MaxRectsBssf/SORT_SSIDE",
+    "MaxRectsBl/SORT_PERI",
+    "SkylineMwflWm/SORT_SSIDE",
+    "GuillotineBafSlas/SORT_AREA",
+    "GuillotineBssfSas/SORT_SSIDE",
+)
+DEFAULT_PORTFOLIO_TIME_BUDGET = 10.0
+
+# Pillow releases the GIL while decoding and resampling, so threads scale well up to a point
+DEFAULT_RENDER_WORKERS = min(8, os.cpu_count() or 1)
+
+# Canvases this large are rendered band by band straight into a TIFF on disk
+BANDED_RENDER_MIN_PIXELS = 150_000_000
+DEFAULT_BAND_HEIGHT = 512
+PREVIEW_MAX_SIDE = 2048
+SCREEN_PREVIEW_MAX_SIDE = 1200
+
+# Output formats: file extension and Pillow save options. TIFFs without compression or with
+# deflate go through StripTiffWriter (tile_size for tiled files); LZW goes through libtiff.
+OUTPUT_PROFILES = {
+    "png": {"format": "PNG", "extension": "png", "compress_level": 6},
+    "png-fast": {"format": "PNG", "extension": "png", "compress_level": 1},
+    "png-small": {"format": "PNG", "extension": "png", "compress_level": 9},
+    "jpeg": {"format": "JPEG", "extension": "jpg", "quality": 95, "subsampling": 0},
+    "webp": {"format": "WEBP", "extension": "webp", "quality": 95, "method": 4},
+    "tiff": {"format": "TIFF", "extension": "tiff"},
+    "tiff-lzw": {"format": "TIFF", "extension": "tiff", "compression": "tiff_lzw"},
+    "tiff-deflate": {
+        "format": "TIFF",
+        "extension": "tiff",
+        "compression": "deflate",
+        "tile_size": 256,
+    },
+}
+MAX_IMAGE_SIDE = {"JPEG": 65535, "WEBP": 16383}
+
+
+class LayoutError(Exception):
+    """Raised when the photos cannot be arranged or the collage cannot be written."""
+
+
+# Long-running functions below accept progress, a callable taking (stage, done, total).
+# It is called between units of work (pack attempts, photos, bands) and may raise to
+# abandon the run, which is how the UI cancels superseded jobs.
+def _report(progress, stage, done=None, total=None):
+    if progress is not None:
+        progress(stage, done, total)
+
+
+def parse_ratio(ratio_str):
+    if not ratio_str:
+        return 1.0
+    try:
+        if ":" in ratio_str:
+            width, height = map(float, ratio_str.split(":"))
+            return height / width if width > 0 else 1.0
+        return float(ratio_str)
+    except ValueError:
+        return 1.0
+
+
+def resolve_ratio(value):
+    # Accepts a number, a paper series name or a "w:h" string
+    if isinstance(value, (int, float)):
+        return float(value)
+    if value in PAPER_RATIOS:
+        return PAPER_RATIOS[value]
+    return parse_ratio(value)
+
+
+@dataclass
+class CollageJob:
+    photos: list
+    scale_factors: list = None
+    padding: int = 0
+    ratio: float = PAPER_RATIOS["A Series"]
+    cmyk: bool = False
+    cmyk_profile: str = None  # ICC output profile for the CMYK conversion
+    output_format: str = None  # an OUTPUT_PROFILES name; PNG, or TIFF for CMYK, by default
+    trace: bool = False  # write a <output>.trace.json of the stage timings
+    paper: str = None  # a PAPER_SIZES_MM name: pack onto as many sheets as needed instead
+    dpi: int = DEFAULT_DPI
+    layout_mode: str = "pack"  # "grid": a uniform grid on one sheet of paper (A4 by default)
+    logo: str = None
+    watermark_text: str = ""
+    font: str = "arial.ttf"
+    font_size: int = 24
+    output_dir: str = "."
+    output_name: str = None
+    parallel_search: bool = True
+    render_workers: int = None
+    max_in_flight: int = None
+    banded: bool = None  # None renders in bands only when the canvas is poster-size
+    band_height: int = None
+    strategies: list = None  # packing strategies to try, or "portfolio" for PACK_PORTFOLIO
+    time_budget: float = None
+    optimize_seconds: float = None  # extra time for optimize_layout() after the search
+
+    def __post_init__(self):
+        if self.scale_factors is None:
+            self.scale_factors = [1.0] * len(self.photos)
+        if len(self.scale_factors) != len(self.photos):
+            raise LayoutError("scale_factors must have one entry per photo.")
+        self.padding = max(0, int(self.padding or 0))
+        self.ratio = resolve_ratio(self.ratio)
+        if self.strategies == "portfolio":
+            self.strategies = list(PACK_PORTFOLIO)
+            if self.time_budget is None:
+                self.time_budget = DEFAULT_PORTFOLIO_TIME_BUDGET
+        elif isinstance(self.strategies, str):
+            self.strategies = [self.strategies]
+        if self.layout_mode not in LAYOUT_MODES:
+            raise LayoutError(f"Unknown layout mode {self.layout_mode!r}.")
+
+    @classmethod
+    def from_dict(cls, data, base_dir=""):
+        # Relative paths in a job description are resolved against base_dir
+        def resolve(path):
+            return path if not path or os.path.isabs(path) else os.path.join(base_dir, path)
+
+        data = dict(data)
+        data["photos"] = [resolve(p) for p in data.get("photos", [])]
+        data["logo"] = resolve(data.get("logo"))
+        data["cmyk_profile"] = resolve(data.get("cmyk_profile"))
+        data["output_dir"] = resolve(data.get("output_dir", "."))
+        known = cls.__dataclass_fields__
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        data.setdefault("output_name", os.path.splitext(os.path.basename(path))[0])
+        return cls.from_dict(data, base_dir=os.path.dirname(os.path.abspath(path)))
+
+
+@dataclass
+class Layout:
+    canvas_width: int
+    canvas_height: int
+    orientation: str
+    padding: int
+    sizes: list  # scaled (w, h) of every photo, indexed by rid
+    rects: list = field(default_factory=list)  # rectpack rect_list() tuples
+    pack_attempts: int = 0
+    cached: bool = False
+    strategy: str = PACK_ALGORITHM  # rectpack algorithm/sort that produced the packing
+    timeline: list = field(default_factory=list)  # (seconds, unused %) while being optimized
+
+    def placements(self):
+        # Yields (rid, x, y, w, h, rotated) with w/h being the photo size on the canvas
+        for _, x, y, w, h, rid in self.rects:
+            scaled_w, scaled_h = self.sizes[rid]
+            rotated = (
+                w == scaled_h + 2 * self.padding
+                and h == scaled_w + 2 * self.padding
+                and scaled_w != scaled_h
+            )
+            if rotated:
+                scaled_w, scaled_h = scaled_h, scaled_w
+            yield rid, x, y, scaled_w, scaled_h, rotated
+
+    @property
+    def canvas_area(self):
+        return self.canvas_width * self.canvas_height
+
+    @property
+    def area_percentages(self):
+        percentages = [0.0] * len(self.sizes)
+        if self.canvas_area > 0:
+            for rid, _, _, w, h, _ in self.placements():
+                percentages[rid] = (w * h / self.canvas_area) * 100
+        return percentages
+
+    @property
+    def unused_pct(self):
+        if self.canvas_area <= 0:
+            return 0.0
+        # Photos placed here only; a sheet of a multi-sheet layout holds just some of them
+        used = sum(w * h for _, _, _, w, h, _ in self.placements())
+        return ((self.canvas_area - used) / self.canvas_area) * 100
+
+    def to_dict(self):
+        return {
+            "canvas_width": self.canvas_width,
+            "canvas_height": self.canvas_height,
+            "orientation": self.orientation,
+            "padding": self.padding,
+            "unused_pct": self.unused_pct,
+            "pack_attempts": self.pack_attempts,
+            "cached": self.cached,
+            "strategy": self.strategy,
+            "timeline": self.timeline,
+            "placements": [
+                {"rid": rid, "x": x, "y": y, "width": w, "height": h, "rotated": rotated}
+                for rid, x, y, w, h, rotated in self.placements()
+            ],
+        }
+
+
+def scaled_sizes(orig_sizes, scale_factors):
+    return [
+        (max(1, int(w * s)), max(1, int(h * s))) for (w, h), s in zip(orig_sizes, scale_factors)
+    ]
+
+
+# Padded (w, h, rid) triples, built once and reused by every pack attempt
+def padded_rects(sizes, padding):
+    return [(w + 2 * padding, h + 2 * padding, rid) for rid, (w, h) in enumerate(sizes)]
+
+
+# A packing strategy is "<rectpack algorithm>/<rectpack sort>", e.g. "MaxRectsBssf/SORT_AREA"
+def parse_strategy(strategy):
+    algorithm, _, sort = strategy.partition("/")
+    pack_algo = getattr(rectpack, algorithm, None)
+    sort_algo = getattr(rectpack, sort or "SORT_AREA", None)
+    if not isinstance(pack_algo, type) or not callable(sort_algo):
+        raise LayoutError(f"Unknown packing strategy: {strategy}")
+    return pack_algo, sort_algo
+
+
+def pack_rects(rects, canvas_width, canvas_height, strategy=PACK_ALGORITHM):
+    pack_algo, sort_algo = parse_strategy(strategy)
+    packer = newPacker(rotation=True, pack_algo=pack_algo, sort_algo=sort_algo)
+    for w, h, rid in rects:
+        packer.add_rect(w, h, rid=rid)
+    packer.add_bin(canvas_width, canvas_height)
+    packer.pack()
+    return packer.rect_list()
+
+
+@dataclass
+class CanvasSearch:
+    width: int = None
+    height: int = None
+    rects: list = None  # packing of the winning canvas, reused for the final layout
+    attempts: int = 0
+    strategy: str = PACK_ALGORITHM
+
+    @property
+    def area(self):
+        return self.width * self.height if self.width else math.inf
+
+
+# Find the smallest canvas of the given ratio (height / width) that fits all photos.
+# The search starts at the total-area lower bound, gallops upwards with doubling steps
+# until a packing succeeds and then bisects between the last failure and that success.
+# best_area is shared with the searches running alongside this one: once this search cannot
+# get below the smallest area found so far it gives up with an empty result. Past the
+# deadline (a time.monotonic() value) it stops too, keeping the best canvas found by then.
+def find_min_canvas(
+    sizes, padding, ratio, best_area=None, progress=None, strategy=PACK_ALGORITHM, deadline=None
+):
+    rects = padded_rects(sizes, padding)
+    search = CanvasSearch(strategy=strategy)
+
+    def fits(width):
+        _report(progress, "search", search.attempts)
+        search.attempts += 1
+        packed = pack_rects(rects, width, int(width * ratio), strategy)
+        return packed if len(packed) == len(rects) else None
+
+    def beaten(width):
+        return best_area is not None and width * int(width * ratio) > best_area.value
+
+    def expired():
+        return deadline is not None and time.monotonic() > deadline
+
+    min_side_req = max(min(w, h) for w, h, _ in rects)
+    max_side_req = max(max(w, h) for w, h, _ in rects)
+    total_area = sum(w * h for w, h, _ in rects)
+    low = max(
+        min_side_req,
+        math.ceil(max_side_req / ratio),
+        math.ceil(math.sqrt(total_area / ratio)),
+    )
+    limit = sum(max(w, h) for w, h, _ in rects) * 2
+
+    # Gallop: low is the smallest width not yet known to fail
+    step = max(1, low // 32)
+    high = low
+    while True:
+        if high > limit or expired():
+            return search
+        if beaten(high):
+            # Do not step over the last widths that could still beat the shared bound
+            high = _widest_canvas(best_area.value, ratio, low)
+            packed = fits(high) if high >= low else None
+            if not packed:
+                return search
+            break
+        packed = fits(high)
+        if packed:
+            break
+        low = high + 1
+        high += step
+        step *= 2
+
+    best_width, best_rects = high, packed
+    while low < high:
+        if beaten(low) or expired():
+            break
+        mid = (low + high) // 2
+        packed = fits(mid)
+        if packed:
+            high = mid
+            best_width, best_rects = mid, packed
+        else:
+            low = mid + 1
+
+    search.width, search.height = best_width, int(best_width * ratio)
+    search.rects = best_rects
+    if best_area is not None and search.area < best_area.value:
+        best_area.value = search.area
+    return search
+
+
+# Widest canvas of this ratio whose area is at most area (below it with strict), or one
+# narrower than low if there is none from low up
+def _widest_canvas(area, ratio, low, strict=False):
+    width = int(math.sqrt(max(0.0, area) / ratio)) + 1
+    while width >= low:
+        canvas_area = width * int(width * ratio)
+        if canvas_area < area or (canvas_area == area and not strict):
+            break
+        width -= 1
+    return width
+
+
+# The area bound of the searches running in this worker process, set by _run_bounded
+_shared_best_area = None
+
+
+def _init_bound_worker(best_area):
+    global _shared_best_area
+    _shared_best_area = best_area
+
+
+def _bounded_call(task):
+    fn, args = task
+    return fn(_shared_best_area, *args)
+
+
+# Runs fn(best_area, *args) for each args in tasks on a process pool, best_area being one
+# value shared by all of them that starts at area. on_wait is called while they run; if it
+# raises, the bound is set below any real area so every task stops at its next check.
+# Returns the results in task order, or None on platforms without working process support.
+def _run_bounded(fn, tasks, area, workers, on_wait):
+    try:
+        best_area = multiprocessing.RawValue("d", area)
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_bound_worker, initargs=(best_area,)
+        ) as pool:
+            futures = [pool.submit(_bounded_call, (fn, args)) for args in tasks]
+            try:
+                while wait(futures, timeout=0.1).not_done:
+                    on_wait()
+            except BaseException:
+                best_area.value = -1.0
+                raise
+            return [future.result() for future in futures]
+    except (OSError, NotImplementedError, BrokenProcessPool):
+        return None
+
+
+def _search_task(best_area, sizes, padding, ratio, strategy, deadline):
+    return find_min_canvas(sizes, padding, ratio, best_area, None, strategy, deadline)
+
+
+# Run the (ratio, strategy, deadline) searches on a process pool, all sharing one area
+# bound. Returns None when there is no process support, to search serially instead.
+def _search_parallel(sizes, padding, tasks, progress=None):
+    workers = min(len(tasks), max(2, os.cpu_count() or 1))
+    return _run_bounded(
+        _search_task,
+        [(sizes, padding) + task for task in tasks],
+        math.inf,
+        workers,
+        lambda: _report(progress, "search"),
+    )
+
+
+# Packs the photos on the smallest canvas of the given ratio, in either orientation.
+# With several strategies (a portfolio) every one of them is searched and the smallest
+# canvas wins; ties go to the earlier strategy and to portrait. time_budget (seconds) cuts
+# the other strategies short, the first one always runs to the end so there is a result.
+def compute_layout(
+    sizes,
+    padding,
+    ratio,
+    parallel=True,
+    cache=None,
+    progress=None,
+    strategies=None,
+    time_budget=None,
+):
+    if not sizes:
+        raise LayoutError("No images to pack.")
+    strategies = list(strategies or [PACK_ALGORITHM])
+    for strategy in strategies:
+        parse_strategy(strategy)
+
+    algorithm = ",".join(strategies)
+    if len(strategies) > 1 and time_budget is not None:
+        algorithm += f"@{time_budget:g}s"
+    key = layout_key(sizes, padding, ratio, algorithm)
+    with traced("search", photos=len(sizes)) as counts:
+        entry = cache.get(key) if cache is not None else None
+        if entry is not None:
+            counts["cached"] = 1
+            return Layout(
+                entry["canvas_width"],
+                entry["canvas_height"],
+                entry["orientation"],
+                padding,
+                sizes,
+                entry["rects"],
+                cached=True,
+                strategy=entry.get("strategy", PACK_ALGORITHM),
+            )
+
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        tasks = [
+            (r, strategy, deadline if i else None)
+            for i, strategy in enumerate(strategies)
+            for r in (ratio, 1 / ratio)
+        ]
+        results = None
+        if parallel and len(sizes) >= PARALLEL_SEARCH_MIN_PHOTOS:
+            results = _search_parallel(sizes, padding, tasks, progress)
+        if results is None:
+            best_area = SimpleNamespace(value=math.inf)
+            results = [
+                find_min_canvas(sizes, padding, r, best_area, progress, strategy, task_deadline)
+                for r, strategy, task_deadline in tasks
+            ]
+
+        best, orientation = CanvasSearch(), None
+        for i, search in enumerate(results):
+            if search.area < best.area:
+                best, orientation = search, ("portrait", "landscape")[i % 2]
+        if best.width is None:
+            raise LayoutError("Could not fit all images.")
+
+        if cache is not None:
+            cache.put(
+                key,
+                {
+                    "canvas_width": best.width,
+                    "canvas_height": best.height,
+                    "orientation": orientation,
+                    "rects": best.rects,
+                    "strategy": best.strategy,
+                },
+            )
+
+        # The winning search already holds a complete packing, so no final repack is needed
+        counts["pack_attempts"] = sum(search.attempts for search in results)
+        return Layout(
+            best.width,
+            best.height,
+            orientation,
+            padding,
+            sizes,
+            best.rects,
+            pack_attempts=counts["pack_attempts"],
+            strategy=best.strategy,
+        )
+
+
+# Sheet size in pixels of a PAPER_SIZES_MM paper at dpi, portrait
+def sheet_size(paper, dpi=DEFAULT_DPI):
+    if paper not in PAPER_SIZES_MM:
+        raise LayoutError(f"Unknown paper size: {paper}")
+    if dpi <= 0:
+        raise LayoutError("DPI must be positive.")
+    width_mm, height_mm = PAPER_SIZES_MM[paper]
+    return round(width_mm / 25.4 * dpi), round(height_mm / 25.4 * dpi)
+
+
+# Photos that do not fit on a sheet in either orientation are shrunk until they do
+def fit_sizes_to_sheet(sizes, padding, sheet_width, sheet_height):
+    room_w, room_h = sheet_width - 2 * padding, sheet_height - 2 * padding
+    if room_w < 1 or room_h < 1:
+        raise LayoutError("The padding leaves no room on the sheet.")
+    fitted = []
+    for w, h in sizes:
+        if (w <= room_w and h <= room_h) or (h <= room_w and w <= room_h):
+            fitted.append((w, h))
+            continue
+        scale = max(min(room_w / w, room_h / h), min(room_w / h, room_h / w))
+        fitted.append((max(1, int(w * scale)), max(1, int(h * scale))))
+    return fitted
+
+
+# Packs the photos onto as few sheets of sheet_width x sheet_height as possible in one pass
+# of rectpack's multi-bin packer; every strategy is tried with each SHEET_BIN_ALGORITHMS
+# heuristic and the fewest sheets win (ties go to the earlier combination). Returns one
+# Layout per sheet; they share the (possibly shrunk) sizes, each holds its own photos.
+def pack_sheets(
+    sizes, padding, sheet_width, sheet_height, cache=None, progress=None, strategies=None
+):
+    if not sizes:
+        raise LayoutError("No images to pack.")
+    strategies = list(strategies or [PACK_ALGORITHM])
+    sizes = fit_sizes_to_sheet(sizes, padding, sheet_width, sheet_height)
+    orientation = "portrait" if sheet_height >= sheet_width else "landscape"
+
+    def sheet_layouts(sheets, strategy, attempts=0, cached=False):
+        return [
+            Layout(
+                sheet_width,
+                sheet_height,
+                orientation,
+                padding,
+                sizes,
+                rects,
+                pack_attempts=attempts,
+                cached=cached,
+                strategy=strategy,
+            )
+            for rects in sheets
+        ]
+
+    key = layout_key(
+        sizes,
+        padding,
+        sheet_height / sheet_width,
+        f"{','.join(strategies)}|sheets@{sheet_width}x{sheet_height}",
+    )
+    with traced("search", photos=len(sizes)) as counts:
+        entry = cache.get(key) if cache is not None else None
+        if entry is not None:
+            # Cached as one rects list; every rect's first field is the sheet it is on
+            sheets = {}
+            for rect in entry["rects"]:
+                sheets.setdefault(rect[0], []).append(rect)
+            sheets = [sheets[index] for index in sorted(sheets)]
+            counts["cached"], counts["sheets"] = 1, len(sheets)
+            return sheet_layouts(sheets, entry["strategy"], cached=True)
+
+        rects = padded_rects(sizes, padding)
+        combinations = [(s, b) for s in strategies for b in SHEET_BIN_ALGORITHMS]
+        best, best_strategy = None, None
+        for attempt, (strategy, bin_algo) in enumerate(combinations, 1):
+            _report(progress, "search", attempt, len(combinations))
+            pack_algo, sort_algo = parse_strategy(strategy)
+            packer = newPacker(
+                mode=PackingMode.Offline,
+                bin_algo=getattr(PackingBin, bin_algo),
+                pack_algo=pack_algo,
+                sort_algo=sort_algo,
+                rotation=True,
+            )
+            for w, h, rid in rects:
+                packer.add_rect(w, h, rid=rid)
+            packer.add_bin(sheet_width, sheet_height, count=float("inf"))
+            packer.pack()
+            packed = packer.rect_list()
+            if len(packed) != len(rects):
+                continue
+            sheets = [[] for _ in range(len(packer))]
+            for rect in packed:
+                sheets[rect[0]].append(rect)
+            sheets = [sheet for sheet in sheets if sheet]
+            if best is None or len(sheets) < len(best):
+                best, best_strategy = sheets, f"{strategy}+{bin_algo}"
+        if best is None:
+            raise LayoutError("Could not fit all images.")
+
+        if cache is not None:
+            packed = [rect for sheet in best for rect in sheet]
+            cache.put(key, {"rects": packed, "strategy": best_strategy})
+        counts["pack_attempts"], counts["sheets"] = len(combinations), len(best)
+        return sheet_layouts(best, best_strategy, attempts=len(combinations))
+
+
+def blank_canvas(mode, size):
+    return Image.new(mode, size, (255, 255, 255) if mode == "RGB" else (0, 0, 0, 0))
+
+
+# Decode, orient and resize one photo to its size on the canvas; runs on a render thread.
+# Rotation is an exact transpose applied after the downscale, so it only moves the small image.
+def _prepare_photo(photo, w, h, rotated, mode, proxies=None):
+    size = (h, w) if rotated else (w, h)
+    if proxies is not None:
+        photo = proxies.source_for(photo, size)
+    with traced("resize", photos=1), load_photo(photo, size) as img:
+        if img.mode != mode:
+            img = img.convert(mode)
+        img_resized = img.resize(size, Image.Resampling.LANCZOS)
+    if rotated:
+        img_resized = img_resized.transpose(Image.Transpose.ROTATE_90)
+    return img_resized
+
+
+# Photos are decoded and resized on a thread pool and pasted in layout order straight
+# onto the white canvas, inside their padding. At most max_in_flight prepared photos
+# exist at any time; each one is released as soon as it is on the canvas.
+def render_collage(layout, photos, workers=None, max_in_flight=None, progress=None):
+    mode = "RGB"
+    canvas = blank_canvas(mode, (layout.canvas_width, layout.canvas_height))
+    padding = layout.padding
+    workers = max(1, workers or DEFAULT_RENDER_WORKERS)
+    max_in_flight = max(1, max_in_flight or 2 * workers)
+    pending = deque()
+    pasted = 0
+
+    def paste_next():
+        nonlocal pasted
+        x, y, future = pending.popleft()
+        canvas.paste(future.result(), (x + padding, y + padding))
+        pasted += 1
+        _report(progress, "render", pasted, len(layout.rects))
+
+    with traced("composite", photos=len(layout.rects)):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for rid, x, y, w, h, rotated in layout.placements():
+                if len(pending) >= max_in_flight:
+                    paste_next()
+                future = submit_traced(pool, _prepare_photo, photos[rid], w, h, rotated, mode)
+                pending.append((x, y, future))
+            while pending:
+                paste_next()
+
+    return canvas
+
+
+# Screen-resolution preview: the same placements scaled down to fit max_side, with every
+# photo decoded at reduced size. extras are (image, (x, y)) overlays in canvas coordinates.
+# With a ProxyCache, photos are drawn from their cached proxies whenever those are big enough.
+def render_preview(
+    layout,
+    photos,
+    max_side=SCREEN_PREVIEW_MAX_SIDE,
+    extras=(),
+    workers=None,
+    progress=None,
+    proxies=None,
+):
+    width, height = layout.canvas_width, layout.canvas_height
+    padding = layout.padding
+    scale = min(1.0, max_side / max(width, height))
+    preview = Image.new(
+        "RGB", (max(1, round(width * scale)), max(1, round(height * scale))), (255, 255, 255)
+    )
+
+    with traced("preview", photos=len(layout.rects)):
+        with ThreadPoolExecutor(max_workers=max(1, workers or DEFAULT_RENDER_WORKERS)) as pool:
+            pending = []
+            for rid, x, y, w, h, rotated in layout.placements():
+                left, top = round((x + padding) * scale), round((y + padding) * scale)
+                preview_w = max(1, round((x + padding + w) * scale) - left)
+                preview_h = max(1, round((y + padding + h) * scale) - top)
+                future = submit_traced(
+                    pool, _prepare_photo, photos[rid], preview_w, preview_h, rotated, "RGB", proxies
+                )
+                pending.append(((left, top), future))
+            for done, (position, future) in enumerate(pending, 1):
+                preview.paste(future.result(), position)
+                _report(progress, "preview", done, len(pending))
+
+    for img, (x, y) in extras:
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        img = img if img.mode == "RGB" else img.convert("RGB")
+        preview.paste(
+            img.resize(size, Image.Resampling.LANCZOS), (round(x * scale), round(y * scale))
+        )
+    return preview
+
+
+# Screen preview of a multi-sheet layout: the sheets side by side in rows, each drawn by
+# render_preview with its own branding, on a grey background that shows the sheet edges
+def render_sheets_preview(
+    sheets, photos, max_side=SCREEN_PREVIEW_MAX_SIDE, branding=None, progress=None, proxies=None
+):
+    columns = math.ceil(math.sqrt(len(sheets)))
+    rows = math.ceil(len(sheets) / columns)
+    gap = 8
+    cell = max(1, (max_side - gap * (max(columns, rows) + 1)) // max(columns, rows))
+    tiles = []
+    for done, sheet in enumerate(sheets, 1):
+        extras = []
+        if branding:
+            panel, origin, _ = branding_overlay(sheet, "RGB", **branding)
+            if panel is not None:
+                extras.append((panel, origin))
+        tiles.append(render_preview(sheet, photos, cell, extras, proxies=proxies))
+        _report(progress, "preview", done, len(sheets))
+    tile_w = max(tile.width for tile in tiles)
+    tile_h = max(tile.height for tile in tiles)
+    preview = Image.new(
+        "RGB",
+        (columns * tile_w + (columns + 1) * gap, rows * tile_h + (rows + 1) * gap),
+        (128, 128, 128),
+    )
+    for i, tile in enumerate(tiles):
+        row, column = divmod(i, columns)
+        preview.paste(tile, (gap + column * (tile_w + gap), gap + row * (tile_h + gap)))
+    return preview
+
+
+def image_to_base64(image, image_format="PNG"):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+# Fonts and logos are kept between runs; only their size changes from one layout to the next
+@functools.lru_cache(maxsize=64)
+def _load_font(font_name, font_size):
+    try:
+        return ImageFont.truetype(font_name, size=font_size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+# Largest of font_size, font_size - 2, ... (not below 10) at which text fits max_w x max_h.
+# Text extents grow with the size, so the candidates are bisected instead of walked.
+# Returns (font, text_w, text_h, fits); when nothing fits, the smallest candidate is measured.
+def _fit_font(draw, text, font_name, font_size, max_w, max_h):
+    with traced("font_fit", sizes_tried=0) as counts:
+
+        def measure(size):
+            counts["sizes_tried"] += 1
+            font = _load_font(font_name, size)
+            left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+            return font, right - left, bottom - top
+
+        steps = max(0, (font_size - 10) // 2)
+        low, high = 0, steps
+        fitting = None
+        while low <= high:
+            mid = (low + high) // 2
+            font, text_w, text_h = measure(font_size - 2 * mid)
+            if text_w <= max_w and text_h <= max_h:
+                fitting = font, text_w, text_h, True
+                high = mid - 1
+            else:
+                low = mid + 1
+        return fitting or (*measure(font_size - 2 * steps), False)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_logo(logo_path, modified, mode):
+    # modified (the file's mtime) is only part of the key, so an edited logo is read again
+    with Image.open(logo_path) as logo:
+        logo.load()
+        return logo.convert("CMYK") if mode == "CMYK" else logo.copy()
+
+
+@functools.lru_cache(maxsize=32)
+def _scaled_logo(logo_path, modified, mode, size):
+    return _load_logo(logo_path, modified, mode).resize(size, Image.Resampling.LANCZOS)
+
+
+# Lay out logo and/or watermark text in the largest free space of the layout.
+# Returns (panel, (x, y), status): the panel is a blank image of that free space with the
+# branding drawn on it (None if nothing fits), ready to be pasted onto the canvas or a band.
+def branding_overlay(
+    layout, mode="RGB", logo_path=None, text="", font_name="arial.ttf", font_size=24
+):
+    panel, text_mask, origin, status = branding_layers(
+        layout, mode, logo_path, text, font_name, font_size
+    )
+    if text_mask is not None:
+        panel.paste((0, 0, 0, 255) if mode == "CMYK" else (0, 0, 0), (0, 0), text_mask)
+    return panel, origin, status
+
+
+# branding_overlay with the watermark text kept apart: returns (panel, text_mask, (x, y),
+# status), where the panel holds only the logo and text_mask (an "L" image the size of the
+# panel, None without text) the coverage of the text, so it can be inked separately.
+def branding_layers(
+    layout, mode="RGB", logo_path=None, text="", font_name="arial.ttf", font_size=24
+):
+    shop_text = (text or "").strip()
+    logo_available = bool(logo_path) and os.path.exists(logo_path)
+    if not (logo_available or shop_text):
+        return None, None, None, "No logo or watermark text selected."
+
+    with traced("branding"):
+        try:
+            free_rect = largest_free_rect(
+                layout.canvas_width, layout.canvas_height, layout.rects, min_size=50
+            )
+            if free_rect is None:
+                return (
+                    None,
+                    None,
+                    None,
+                    "No free space available to add logo or watermark text.",
+                )
+
+            # Drawing happens in the coordinates of the largest free rectangle
+            origin_x, origin_y, fw, fh = free_rect
+            fx, fy = 0, 0
+            cmyk = mode == "CMYK"
+            panel = blank_canvas(mode, (fw, fh))
+            draw = ImageDraw.Draw(panel)
+            text_mask = None
+            logo_w, logo_h, scaled_logo_w, scaled_logo_h = 0, 0, 0, 0
+            text_w, text_h = 0, 0
+            logo_x = fx
+            logo_added = False
+            text_added = False
+
+            # Calculate text size if watermark text is non-empty
+            text_fits = bool(shop_text)
+            font = None
+            if shop_text:
+                # Use a smaller font size if the text doesn't fit
+                font, text_w, text_h, text_fits = _fit_font(
+                    draw, shop_text, font_name, font_size, fw, fh
+                )
+
+            # Calculate logo size if available
+            if logo_available:
+                logo_key = (logo_path, os.path.getmtime(logo_path), "CMYK" if cmyk else "RGB")
+                logo_w, logo_h = _load_logo(*logo_key).size
+                logo_scale = 0.98
+                if shop_text and text_fits:
+                    scale = min(fw / logo_w, (fh - text_h - 10) / logo_h, 1.0) * logo_scale
+                else:
+                    scale = min(fw / logo_w, fh / logo_h, 1.0) * logo_scale
+                scaled_logo_w = max(0, int(logo_w * scale))
+                scaled_logo_h = max(0, int(logo_h * scale))
+
+            # Check if logo and text fit side by side
+            total_width = (
+                scaled_logo_w + 10 + text_w
+                if shop_text and logo_available and text_fits
+                else (text_w if shop_text and text_fits else scaled_logo_w if logo_available else 0)
+            )
+            if total_width > fw or max(scaled_logo_h, text_h if shop_text and text_fits else 0) > fh:
+                # Try fitting only logo or only text if both don't fit
+                if logo_available and shop_text and text_fits:
+                    if scaled_logo_w <= fw and scaled_logo_h <= fh:
+                        total_width = scaled_logo_w
+                        text_fits = False
+                    elif text_w <= fw and text_h <= fh:
+                        total_width = text_w
+                        scaled_logo_w = scaled_logo_h = 0
+                    else:
+                        total_width = 0
+                        text_fits = False
+                        scaled_logo_w = scaled_logo_h = 0
+                elif shop_text and text_fits and text_w > fw:
+                    text_fits = False
+                    total_width = scaled_logo_w if logo_available else 0
+                elif logo_available and scaled_logo_w > fw:
+                    scaled_logo_w = scaled_logo_h = 0
+                    total_width = text_w if shop_text and text_fits else 0
+
+            # Paste logo if it fits
+            if logo_available and scaled_logo_w > 0 and scaled_logo_h > 0:
+                logo_resized = _scaled_logo(*logo_key, (scaled_logo_w, scaled_logo_h))
+                logo_x = fx + (fw - total_width) // 2
+                logo_y = fy + (fh - scaled_logo_h) // 2
+                panel.paste(logo_resized, (logo_x, logo_y))
+                logo_added = True
+
+            # Draw text if not empty and fits
+            if shop_text and text_fits:
+                text_x = (logo_x + scaled_logo_w + 10) if logo_added else fx + (fw - text_w) // 2
+                text_y = fy + (fh - text_h) // 2
+                text_mask = Image.new("L", (fw, fh), 0)
+                ImageDraw.Draw(text_mask).text((text_x, text_y), shop_text, font=font, fill=255)
+                text_added = True
+        except Exception as ex:
+            return None, None, None, f"Error loading or adding logo/watermark: {str(ex)}"
+
+        origin = (origin_x, origin_y)
+        if logo_added and text_added:
+            status = "Logo and watermark text maximized in largest free space."
+        elif logo_added and shop_text:
+            status = "Logo maximized in largest free space, but watermark text does not fit."
+        elif logo_added:
+            status = "Logo maximized in largest free space."
+        elif text_added:
+            status = "Watermark text maximized in largest free space."
+        else:
+            return None, None, None, "Free space too small to add logo or watermark text."
+        return panel, text_mask, origin, status
+
+
+# Maximal empty rectangles of the canvas, scanned row by row over a grid whose lines are
+# the canvas and photo edges (exact, no downsampling). Each grid row is the base of a
+# histogram of free heights; the stack pass over it yields every maximal rectangle
+# resting on that row, so the scan is linear in the number of grid cells.
+def _empty_rectangles(canvas_width, canvas_height, rects):
+    boxes = np.array([(x, y, x + w, y + h) for _, x, y, w, h, _ in rects], dtype=np.int64)
+    boxes = boxes.reshape(-1, 4)
+    boxes[:, 0::2] = boxes[:, 0::2].clip(0, canvas_width)
+    boxes[:, 1::2] = boxes[:, 1::2].clip(0, canvas_height)
+    xs = np.unique(np.concatenate(([0, canvas_width], boxes[:, 0], boxes[:, 2])))
+    ys = np.unique(np.concatenate(([0, canvas_height], boxes[:, 1], boxes[:, 3])))
+
+    # Occupancy of every grid cell from a 2D difference array, one entry per photo corner
+    x0, x1 = np.searchsorted(xs, boxes[:, 0]), np.searchsorted(xs, boxes[:, 2])
+    y0, y1 = np.searchsorted(ys, boxes[:, 1]), np.searchsorted(ys, boxes[:, 3])
+    coverage = np.zeros((len(ys), len(xs)), dtype=np.int32)
+    np.add.at(coverage, (y0, x0), 1)
+    np.add.at(coverage, (y0, x1), -1)
+    np.add.at(coverage, (y1, x0), -1)
+    np.add.at(coverage, (y1, x1), 1)
+    free = coverage.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] == 0
+
+    row_heights = np.diff(ys)
+    heights = np.zeros(len(xs) - 1, dtype=np.int64)
+    col_x = xs.tolist()
+    last_row = len(ys) - 2
+    for row, bottom in enumerate(ys[1:].tolist()):
+        heights = np.where(free[row], heights + row_heights[row], 0)
+        # Free cells per column prefix of the next row: a rectangle that the next row could
+        # extend downwards is not maximal, it shows up again resting on a lower row
+        below = None if row == last_row else np.concatenate(([0], free[row + 1].cumsum()))
+        stack = []  # (first column, height), heights strictly increasing
+        for col, height in enumerate(heights.tolist() + [0]):
+            start = col
+            while stack and stack[-1][1] > height:
+                start, top_height = stack.pop()
+                if below is None or below[col] - below[start] < col - start:
+                    yield col_x[start], bottom - top_height, col_x[col] - col_x[start], top_height
+            if height and (not stack or stack[-1][1] < height):
+                stack.append((start, height))
+
+
+# Largest empty (x, y, w, h) area of the canvas at least min_size on both sides, or None
+def largest_free_rect(canvas_width, canvas_height, rects, min_size=50):
+    best = None
+    for x, y, w, h in _empty_rectangles(canvas_width, canvas_height, rects):
+        if w >= min_size and h >= min_size and (best is None or w * h > best[2] * best[3]):
+            best = (x, y, w, h)
+    return best
+
+
+# Maximal empty rectangles of the canvas at least min_size on both sides, largest first
+def find_free_spaces(canvas_width, canvas_height, rects, min_size=50):
+    spaces = {
+        space
+        for space in _empty_rectangles(canvas_width, canvas_height, rects)
+        if space[2] >= min_size and space[3] >= min_size
+    }
+    return sorted(spaces, key=lambda r: (-r[2] * r[3], r[1], r[0]))
+
+
+def default_output_name():
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"a_series_photo_layout_{timestamp}"
+
+
+def output_paths(output_dir, output_name, extension, separate_preview):
+    output_name = output_name or default_output_name()
+    output_path = os.path.join(output_dir, f"{output_name}.{extension}")
+    if separate_preview:
+        return output_path, os.path.join(output_dir, f"{output_name}_preview.png")
+    return output_path, output_path
+
+
+# Write an RGB canvas to a striped (or, with tile_size, tiled) TIFF band by band. With a
+# converter each band is turned into CMYK just before it is written, so a full-size CMYK
+# copy of the canvas never exists. Returns the seconds spent compressing and writing.
+def write_tiff(
+    canvas,
+    output_path,
+    converter=None,
+    band_height=None,
+    compression=None,
+    tile_size=None,
+    workers=None,
+):
+    band_height = tile_size or max(1, band_height or DEFAULT_BAND_HEIGHT)
+    width, height = canvas.size
+    with StripTiffWriter(
+        output_path,
+        width,
+        height,
+        "CMYK" if converter else "RGB",
+        compression=compression,
+        icc_profile=converter.icc_profile if converter else None,
+        tile_size=tile_size,
+        workers=workers,
+    ) as tiff:
+        for top in range(0, height, band_height):
+            band = canvas.crop((0, top, width, min(height, top + band_height)))
+            tiff.write_band(converter(band, top) if converter else band)
+    return tiff.encode_seconds
+
+
+def output_profile(name, cmyk=False):
+    # None picks what collages have always been saved as: PNG, or TIFF for CMYK
+    name = name or ("tiff" if cmyk else "png")
+    if name not in OUTPUT_PROFILES:
+        raise LayoutError(f"Unknown output format: {name}")
+    profile = OUTPUT_PROFILES[name]
+    if cmyk and profile["format"] not in ("TIFF", "JPEG"):
+        raise LayoutError(f"{profile['format']} files cannot hold CMYK; use a TIFF or JPEG format.")
+    return profile
+
+
+# Encode a composed RGB canvas with an output profile, converting it to CMYK on the way
+# when a converter is given. Returns the encoding time in seconds.
+def encode_collage(canvas, output_path, profile, converter=None, workers=None):
+    trace_values(canvas_pixels=canvas.width * canvas.height, output_format=profile["format"])
+    started = time.perf_counter()
+    options = {k: v for k, v in profile.items() if k not in ("format", "extension")}
+    limit = MAX_IMAGE_SIDE.get(profile["format"])
+    if limit and max(canvas.size) > limit:
+        raise LayoutError(
+            f"{profile['format']} images are limited to {limit} pixels per side; "
+            f"this canvas is {canvas.width}x{canvas.height}. Use a TIFF format."
+        )
+    try:
+        if profile["format"] == "TIFF" and options.get("compression") in (None, "deflate"):
+            write_tiff(canvas, output_path, converter, workers=workers, **options)
+        else:
+            image = converter(canvas) if converter else canvas
+            if converter and converter.icc_profile:
+                options["icc_profile"] = converter.icc_profile
+            image.save(output_path, format=profile["format"], **options)
+    except LayoutError:
+        raise
+    except Exception as ex:
+        raise LayoutError(f"Error saving file: {str(ex)}") from ex
+    seconds = time.perf_counter() - started
+    trace_add("encode", seconds)
+    return seconds
+
+
+# Runs fn right away; the result (or error) comes back as a finished Future, like the ones
+# a BackgroundWriter hands out
+def _run_inline(fn, *args):
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as ex:
+        future.set_exception(ex)
+    return future
+
+
+# Poster-size collages are rendered in horizontal bands that are streamed into a striped
+# TIFF (BigTIFF once it could pass 4 GB), so only one band and the photos crossing it are
+# in memory. Bands are composed in RGB; a small RGB preview is built from them on the way
+# and returned, and with cmyk each band is converted just before it is written.
+# extras are (image, (x, y)) overlays such as the branding panel.
+def render_banded(
+    layout,
+    photos,
+    output_path,
+    cmyk=False,
+    band_height=None,
+    extras=(),
+    workers=None,
+    max_in_flight=None,
+    preview_max_side=PREVIEW_MAX_SIDE,
+    progress=None,
+    converter=None,
+    compression="deflate",
+    tile_size=None,
+):
+    mode = "RGB"
+    if cmyk:
+        converter = converter or CmykConverter()
+    if tile_size:
+        band_height = tile_size
+    width, height = layout.canvas_width, layout.canvas_height
+    padding = layout.padding
+    band_height = max(1, band_height or DEFAULT_BAND_HEIGHT)
+    workers = max(1, workers or DEFAULT_RENDER_WORKERS)
+    max_in_flight = max(1, max_in_flight or 2 * workers)
+    scale = min(1.0, preview_max_side / max(width, height))
+    preview = Image.new(
+        "RGB", (max(1, round(width * scale)), max(1, round(height * scale))), (255, 255, 255)
+    )
+
+    started = time.perf_counter()
+    # Photos are prepared ahead in top-to-bottom order and dropped once a band passes them
+    order = sorted(layout.placements(), key=lambda placement: placement[2])
+    next_index = 0
+    queued = deque()  # (x, top, bottom, future) not yet needed by a band
+    active = []  # (x, top, bottom, image) crossing the current band
+
+    with ThreadPoolExecutor(max_workers=workers) as pool, StripTiffWriter(
+        output_path,
+        width,
+        height,
+        "CMYK" if cmyk else "RGB",
+        compression=compression,
+        icc_profile=converter.icc_profile if cmyk else None,
+        tile_size=tile_size,
+        workers=workers,
+    ) as tiff:
+        band_count = math.ceil(height / band_height)
+        for band_index, band_top in enumerate(range(0, height, band_height)):
+            _report(progress, "render", band_index, band_count)
+            band_bottom = min(height, band_top + band_height)
+            while True:
+                while next_index < len(order) and len(queued) < max_in_flight:
+                    rid, x, y, w, h, rotated = order[next_index]
+                    next_index += 1
+                    future = submit_traced(
+                        pool, _prepare_photo, photos[rid], w, h, rotated, mode
+                    )
+                    queued.append((x + padding, y + padding, y + padding + h, future))
+                if not queued or queued[0][1] >= band_bottom:
+                    break
+                x, top, bottom, future = queued.popleft()
+                active.append((x, top, bottom, future.result()))
+
+            band = blank_canvas(mode, (width, band_bottom - band_top))
+            for x, top, _, img in active:
+                band.paste(img, (x, top - band_top))
+            for img, (x, y) in extras:
+                if y < band_bottom and y + img.height > band_top:
+                    band.paste(img, (x, y - band_top))
+            tiff.write_band(converter(band, band_top) if cmyk else band)
+
+            preview_top = round(band_top * scale)
+            preview_bottom = round(band_bottom * scale)
+            if preview_bottom > preview_top:
+                preview.paste(
+                    band.resize(
+                        (preview.width, preview_bottom - preview_top), Image.Resampling.BOX
+                    ),
+                    (0, preview_top),
+                )
+            del band
+            active = [item for item in active if item[2] > band_bottom]
+
+    # Bands are composed and written in turns; the writer keeps the encoding time apart
+    trace_values(canvas_pixels=width * height, output_format="TIFF")
+    trace_add("composite", time.perf_counter() - started - tiff.encode_seconds, photos=len(order))
+    trace_add("encode", tiff.encode_seconds)
+    return preview, tiff.encode_seconds
+
+
+# Black watermark text from branding_layers on an RGB preview of the canvas scaled by scale
+def _paste_text(preview, text_mask, origin, scale=1.0):
+    x, y = origin
+    left, top = round(x * scale), round(y * scale)
+    if scale != 1.0:
+        size = (
+            max(1, round((x + text_mask.width) * scale) - left),
+            max(1, round((y + text_mask.height) * scale) - top),
+        )
+        text_mask = text_mask.resize(size, Image.Resampling.BOX)
+    preview.paste((0, 0, 0), (left, top), text_mask)
+
+
+# Render, brand and write a collage. Canvases of BANDED_RENDER_MIN_PIXELS or more are
+# streamed to TIFF band by band unless banded says otherwise. Everything is composed in
+# RGB; for cmyk the conversion (through the cmyk_profile ICC file if given) happens once,
+# band by band, while the TIFF is written, and the watermark text is inked on K only. profile names an OUTPUT_PROFILES entry; banded
+# output is always TIFF and only takes the compression and tiling from it.
+# With a writer (a BackgroundWriter) the finished canvas is encoded on the writer's thread
+# and this returns as soon as the canvas is handed over.
+# Returns (output_path, preview_path, branding status, future of the encode seconds).
+def render_to_file(
+    layout,
+    photos,
+    output_dir,
+    output_name=None,
+    cmyk=False,
+    branding=None,
+    banded=None,
+    band_height=None,
+    workers=None,
+    max_in_flight=None,
+    progress=None,
+    cmyk_profile=None,
+    profile=None,
+    writer=None,
+):
+    output_format = output_profile(profile, cmyk)
+    trace_values(photos=len(layout.rects), canvas=[layout.canvas_width, layout.canvas_height])
+    converter = None
+    text_mask = None
+    if cmyk:
+        # Rich black text would be printed in all four inks; it goes on K alone after conversion
+        panel, text_mask, origin, branding_status = branding_layers(
+            layout, "RGB", **(branding or {})
+        )
+        try:
+            converter = CmykConverter(
+                cmyk_profile, black_text=(text_mask, origin) if text_mask is not None else None
+            )
+        except (OSError, ImageCms.PyCMSError) as ex:
+            raise LayoutError(f"Cannot use CMYK profile '{cmyk_profile}': {ex}") from ex
+    else:
+        panel, origin, branding_status = branding_overlay(layout, "RGB", **(branding or {}))
+    if banded is None:
+        banded = layout.canvas_area >= BANDED_RENDER_MIN_PIXELS
+
+    if not banded:
+        canvas = render_collage(
+            layout,
+            photos,
+            workers=workers,
+            max_in_flight=max_in_flight,
+            progress=progress,
+        )
+        if panel is not None:
+            canvas.paste(panel, origin)
+        _report(progress, "encode")
+        output_path, preview_path = output_paths(
+            output_dir, output_name, output_format["extension"], cmyk
+        )
+        if cmyk:
+            # The same small preview the banded path builds, not a full-size PNG
+            scale = min(1.0, PREVIEW_MAX_SIDE / max(canvas.size))
+            preview = canvas.resize(
+                (max(1, round(canvas.width * scale)), max(1, round(canvas.height * scale))),
+                Image.Resampling.BOX,
+            )
+            if text_mask is not None:
+                _paste_text(preview, text_mask, origin, preview.width / canvas.width)
+            try:
+                preview.save(preview_path, compress_level=1)
+            except OSError as ex:
+                raise LayoutError(f"Error saving file: {str(ex)}") from ex
+        submit = writer.submit if writer is not None else _run_inline
+        encoding = submit(
+            encode_collage, canvas, output_path, output_format, converter, workers
+        )
+        return output_path, preview_path, branding_status, encoding
+
+    tiff_options = {"compression": "deflate"}
+    if output_format["format"] == "TIFF" and output_format.get("compression") != "tiff_lzw":
+        tiff_options = {
+            "compression": output_format.get("compression"),
+            "tile_size": output_format.get("tile_size"),
+        }
+    output_path, preview_path = output_paths(output_dir, output_name, "tiff", True)
+    try:
+        preview, seconds = render_banded(
+            layout,
+            photos,
+            output_path,
+            cmyk=cmyk,
+            band_height=band_height,
+            extras=[(panel, origin)] if panel is not None else [],
+            workers=workers,
+            max_in_flight=max_in_flight,
+            progress=progress,
+            converter=converter,
+            **tiff_options,
+        )
+        if text_mask is not None:
+            _paste_text(preview, text_mask, origin, preview.width / layout.canvas_width)
+        preview.save(preview_path)
+    except OSError as ex:
+        raise LayoutError(f"Error saving file: {str(ex)}") from ex
+    return output_path, preview_path, branding_status, _run_inline(lambda: seconds)
+
+
+# Render every sheet of a multi-sheet layout to its own file, "<output_name>_sheet01" and
+# so on. Sheets are rendered (and encoded) in parallel, the render workers split between
+# them; progress is reported per finished sheet. Returns render_to_file's result per sheet.
+def render_sheets(
+    sheets,
+    photos,
+    output_dir,
+    output_name=None,
+    cmyk=False,
+    branding=None,
+    workers=None,
+    progress=None,
+    cmyk_profile=None,
+    profile=None,
+):
+    output_name = output_name or default_output_name()
+    workers = max(1, workers or DEFAULT_RENDER_WORKERS)
+    sheet_workers = min(len(sheets), workers)
+    with ThreadPoolExecutor(max_workers=sheet_workers) as pool:
+        futures = [
+            submit_traced(
+                pool,
+                render_to_file,
+                sheet,
+                photos,
+                output_dir,
+                f"{output_name}_sheet{number:02d}",
+                cmyk=cmyk,
+                branding=branding,
+                workers=max(1, workers // sheet_workers),
+                cmyk_profile=cmyk_profile,
+                profile=profile,
+            )
+            for number, sheet in enumerate(sheets, 1)
+        ]
+        try:
+            for done, _ in enumerate(as_completed(futures), 1):
+                _report(progress, "sheets", done, len(futures))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return [future.result() for future in futures]
+
+
+# Output path of a run_job result without its extension (and without "_sheetNN" for
+# multi-sheet jobs); the layout and trace JSON files are written next to it
+def output_base(result):
+    if "sheets" in result:
+        return os.path.splitext(result["outputs"][0])[0].rpartition("_sheet")[0]
+    return os.path.splitext(result["output"])[0]
+
+
+# Run a whole job headlessly: pack, render, brand and save. The result carries the
+# per-stage timings of the run under "stages".
+def run_job(job, cache=None):
+    trace = RunTrace(job.output_name)
+    with trace.activate():
+        result = _run_job(job, cache)
+    trace.finish()
+    result["stages"] = trace.to_dict()["stages"]
+    if job.trace:
+        result["trace_file"] = output_base(result) + TRACE_SUFFIX
+        trace.write(result["trace_file"])
+    return result
+
+
+def _run_job(job, cache=None):
+    photos = [read_photo_info(path) for path in job.photos]
+    sizes = scaled_sizes([photo.size for photo in photos], job.scale_factors)
+    branding = {
+        "logo_path": job.logo,
+        "text": job.watermark_text,
+        "font_name": job.font,
+        "font_size": job.font_size,
+    }
+    output_format = job.output_format or ("tiff" if job.cmyk else "png")
+    if job.layout_mode == "grid":
+        # Imported here: the grid module builds on this one
+        from .grid import grid_layout
+
+        layout = grid_layout(sizes, job.padding, *sheet_size(job.paper or "A4", job.dpi))
+    elif job.paper:
+        sheet_width, sheet_height = sheet_size(job.paper, job.dpi)
+        sheets = pack_sheets(
+            sizes, job.padding, sheet_width, sheet_height, cache=cache, strategies=job.strategies
+        )
+        results = render_sheets(
+            sheets,
+            photos,
+            job.output_dir,
+            job.output_name,
+            cmyk=job.cmyk,
+            branding=branding,
+            workers=job.render_workers,
+            cmyk_profile=job.cmyk_profile,
+            profile=job.output_format,
+        )
+        return {
+            "outputs": [output for output, _, _, _ in results],
+            "previews": [preview for _, preview, _, _ in results],
+            "branding": [status for _, _, status, _ in results],
+            "output_format": output_format,
+            "encode_seconds": round(sum(encoding.result() for *_, encoding in results), 3),
+            "paper": job.paper,
+            "dpi": job.dpi,
+            "sheets": [sheet.to_dict() for sheet in sheets],
+        }
+
+    else:
+        layout = compute_layout(
+            sizes,
+            job.padding,
+            job.ratio,
+            parallel=job.parallel_search,
+            cache=cache,
+            strategies=job.strategies,
+            time_budget=job.time_budget,
+        )
+    if job.optimize_seconds and job.layout_mode == "pack":
+        # Imported here: the optimizer module builds on this one
+        from .optimize import optimize_layout
+
+        layout = optimize_layout(layout, job.ratio, job.optimize_seconds, cache=cache)
+    output_path, preview_path, branding, encoding = render_to_file(
+        layout,
+        photos,
+        job.output_dir,
+        job.output_name,
+        cmyk=job.cmyk,
+        cmyk_profile=job.cmyk_profile,
+        branding=branding,
+        banded=job.banded,
+        band_height=job.band_height,
+        workers=job.render_workers,
+        max_in_flight=job.max_in_flight,
+        profile=job.output_format,
+    )
+    return {
+        "output": output_path,
+        "preview": preview_path,
+        "branding": branding,
+        "output_format": output_format,
+        "encode_seconds": round(encoding.result(), 3),
+        "layout": layout.to_dict(),
+    }
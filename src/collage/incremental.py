@@ -0,0 +1,125 @@
+import math
+from collections import defaultdict, deque
+
+from .engine import Layout, _empty_rectangles, _report, compute_layout
+from .trace import traced
+
+# An edited layout is kept only while its unused area stays within this many percentage
+# points of the last fully searched one; past that a full search is worth its time
+REPACK_SLACK_PCT = 5.0
+INCREMENTAL_SUFFIX = "+incremental"
+
+
+# Map every photo key in keys to the index it had in previous_keys, or None for new photos.
+# Keys may repeat (the same photo added twice); repeats are matched in order.
+def match_photos(previous_keys, keys):
+    positions = defaultdict(deque)
+    for rid, key in enumerate(previous_keys):
+        positions[key].append(rid)
+    return [positions[key].popleft() if positions[key] else None for key in keys]
+
+
+# Where a w x h rect goes in the free space of the canvas: the free rectangle it fills
+# best (smallest leftover short side), either way round. Returns (x, y, w, h) or None.
+def _find_slot(canvas_width, canvas_height, rects, w, h):
+    best, best_fit = None, None
+    for fx, fy, fw, fh in _empty_rectangles(canvas_width, canvas_height, rects):
+        for rw, rh in ((w, h), (h, w)):
+            if rw <= fw and rh <= fh:
+                fit = min(fw - rw, fh - rh)
+                if best_fit is None or fit < best_fit:
+                    best, best_fit = (fx, fy, rw, rh), fit
+    return best
+
+
+# Smallest canvas of the layout's shape (height = int(width * shape)) that still holds rects
+def _shrunk_canvas(rects, shape, canvas_width):
+    right = max((x + w for _, x, y, w, h, _ in rects), default=1)
+    bottom = max((y + h for _, x, y, w, h, _ in rects), default=1)
+    width = max(right, math.ceil(bottom / shape), 1)
+    while int(width * shape) < bottom:
+        width += 1
+    return min(width, canvas_width)
+
+
+# Update previous (packed for the photos previous_keys) to the photos keys with sizes,
+# touching only what changed: photos that are gone are dropped, photos that shrank stay
+# where they were, and new or grown photos are put into the free space one at a time,
+# largest first. The canvas then shrinks to what the photos still need. When a photo does
+# not fit, or the edited layout wastes more than REPACK_SLACK_PCT points more than
+# baseline_pct (the unused % of the last fully searched layout, previous's by default),
+# this falls back to a full compute_layout search; so does a change of padding or ratio.
+def update_layout(
+    previous,
+    previous_keys,
+    keys,
+    sizes,
+    padding,
+    ratio,
+    progress=None,
+    baseline_pct=None,
+    **search_options,
+):
+    def full_search():
+        return compute_layout(sizes, padding, ratio, progress=progress, **search_options)
+
+    if previous is None or not previous.rects or padding != previous.padding:
+        return full_search()
+    shape = ratio if previous.orientation == "portrait" else 1 / ratio
+    if int(previous.canvas_width * shape) != previous.canvas_height:
+        return full_search()
+
+    old_rids = match_photos(previous_keys, keys)
+    old_slots = {rid: (x, y, w, h) for _, x, y, w, h, rid in previous.rects}
+    old_rotated = {rid: rotated for rid, _, _, _, _, rotated in previous.placements()}
+    rects, pending = [], []
+    for rid, (size, old_rid) in enumerate(zip(sizes, old_rids)):
+        w, h = size[0] + 2 * padding, size[1] + 2 * padding
+        if old_rid is None or old_rid not in old_slots:
+            pending.append((w, h, rid))
+            continue
+        x, y, slot_w, slot_h = old_slots[old_rid]
+        if old_rotated[old_rid]:
+            w, h = h, w
+        if w <= slot_w and h <= slot_h:
+            rects.append((0, x, y, w, h, rid))
+        else:
+            pending.append((w, h, rid))
+
+    if not pending and len(rects) == len(previous.rects) and list(sizes) == list(previous.sizes):
+        return previous
+
+    attempts = 0
+    pending.sort(key=lambda rect: rect[0] * rect[1], reverse=True)
+    with traced("incremental", photos=len(pending)):
+        for w, h, rid in pending:
+            _report(progress, "search", attempts)
+            attempts += 1
+            slot = _find_slot(previous.canvas_width, previous.canvas_height, rects, w, h)
+            if slot is None:
+                break
+            x, y, w, h = slot
+            rects.append((0, x, y, w, h, rid))
+    if len(rects) < len(sizes):
+        return full_search()
+    rects.sort(key=lambda rect: rect[5])
+
+    canvas_width = _shrunk_canvas(rects, shape, previous.canvas_width)
+    strategy = previous.strategy
+    if not strategy.endswith(INCREMENTAL_SUFFIX):
+        strategy += INCREMENTAL_SUFFIX
+    layout = Layout(
+        canvas_width,
+        int(canvas_width * shape),
+        previous.orientation,
+        padding,
+        list(sizes),
+        rects,
+        pack_attempts=attempts,
+        strategy=strategy,
+    )
+    if baseline_pct is None:
+        baseline_pct = previous.unused_pct
+    if layout.unused_pct > baseline_pct + REPACK_SLACK_PCT:
+        return full_search()
+    return layout
@@ -0,0 +1,113 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .trace import submit_traced
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once a newer job has superseded it."""
+
+
+# Handle passed to a running job. progress() doubles as the cancellation point and
+# apply() runs UI updates only while the job is still the newest one.
+class LayoutJob:
+    def __init__(self, runner, generation):
+        self._runner = runner
+        self.generation = generation
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def progress(self, stage, done=None, total=None):
+        if self.cancelled:
+            raise JobCancelled()
+        self.apply(self._runner.on_progress, stage, done, total)
+
+    def apply(self, fn, *args):
+        if fn is None:
+            return False
+        with self._runner._lock:
+            if self.cancelled or self.generation != self._runner._generation:
+                return False
+            fn(*args)
+            return True
+
+
+# Runs layout jobs one at a time off the UI thread. Submitting a job cancels the one in
+# flight; it stops at its next progress() call and never applies its results.
+class LayoutJobRunner:
+    def __init__(self, on_progress=None, on_error=None):
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._current = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="layout-job")
+
+    def submit(self, fn):
+        # fn receives the LayoutJob and does its work through job.progress / job.apply
+        with self._lock:
+            if self._current is not None:
+                self._current.cancel()
+            self._generation += 1
+            job = LayoutJob(self, self._generation)
+            self._current = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def cancel(self):
+        with self._lock:
+            if self._current is not None:
+                self._current.cancel()
+                self._current = None
+            self._generation += 1
+
+    @property
+    def busy(self):
+        with self._lock:
+            return self._current is not None
+
+    def _run(self, job, fn):
+        try:
+            if not job.cancelled:
+                fn(job)
+        except JobCancelled:
+            pass
+        except Exception as ex:
+            job.apply(self.on_error, ex)
+        finally:
+            with self._lock:
+                if self._current is job:
+                    self._current = None
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+
+# Encodes finished collages on one background thread so the next layout can start while
+# the last file is still being compressed. At most max_pending canvases wait for the
+# writer; submit() blocks beyond that, which bounds the memory the queue can hold.
+class BackgroundWriter:
+    def __init__(self, max_pending=1):
+        self._slots = threading.BoundedSemaphore(max_pending + 1)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="collage-writer")
+
+    def submit(self, fn, *args):
+        self._slots.acquire()
+        try:
+            # The caller's trace (if any) also times the encoding on the writer thread
+            future = submit_traced(self._executor, fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
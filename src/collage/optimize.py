@@ -0,0 +1,245 @@
+import math
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+import rectpack
+from rectpack import newPacker
+
+from .cache import layout_key
+from .engine import Layout, _report, _run_bounded, _widest_canvas, padded_rects, parse_strategy
+from .trace import trace_add
+
+# Annealing temperature, as a fraction of the total photo area left unplaced, at the start
+# and at the end of the time budget
+START_TEMPERATURE = 0.05
+END_TEMPERATURE = 0.002
+DEFAULT_OPTIMIZE_WORKERS = min(8, os.cpu_count() or 1)
+DEFAULT_OPTIMIZE_SECONDS = 20.0
+
+
+# Packs rects exactly in the given order and orientation into one canvas. rectpack's
+# own sorting and rotation are switched off; the optimizer makes those choices.
+def pack_in_order(rects, order, rotated, canvas_width, canvas_height, pack_algo):
+    packer = newPacker(rotation=False, pack_algo=pack_algo, sort_algo=rectpack.SORT_NONE)
+    for i in order:
+        w, h, rid = rects[i]
+        if rotated[i]:
+            w, h = h, w
+        packer.add_rect(w, h, rid=rid)
+    packer.add_bin(canvas_width, canvas_height)
+    packer.pack()
+    return packer.rect_list()
+
+
+@dataclass
+class AnnealResult:
+    ratio: float
+    width: int = None
+    height: int = None
+    rects: list = None
+    iterations: int = 0
+    events: list = field(default_factory=list)  # (seconds since start, canvas area)
+
+    @property
+    def area(self):
+        return self.width * self.height if self.width else math.inf
+
+
+# One simulated-annealing chain for one canvas ratio. The state is an insertion order and a
+# rotation flag per photo; its energy is the photo area that does not fit on the target
+# canvas. Whenever everything fits, the canvas is recorded and the target shrinks. The
+# target always stays below best_area, which the chains share, so a chain never works on a
+# canvas another chain has already beaten. Setting best_area below zero stops every chain.
+def anneal(
+    rects, ratio, pack_algo, order, rotated, best_area, started, deadline, seed=0, low=1
+):
+    rng = random.Random(seed)
+    result = AnnealResult(ratio)
+    total_area = sum(w * h for w, h, _ in rects)
+    order, rotated = list(order), list(rotated)
+    turnable = [i for i, (w, h, _) in enumerate(rects) if w != h]
+    budget = max(deadline - started, 1e-9)
+
+    def widest_target():
+        # Widest canvas of this ratio whose area is below the best one found so far
+        return _widest_canvas(best_area.value, ratio, low, strict=True)
+
+    def energy(state_order, state_rotated):
+        packed = pack_in_order(
+            rects, state_order, state_rotated, width, int(width * ratio), pack_algo
+        )
+        result.iterations += 1
+        placed = sum(w * h for _, _, _, w, h, _ in packed)
+        return (total_area - placed) / total_area, packed
+
+    width = widest_target()
+    if width < low:
+        return result
+    current, packed = energy(order, rotated)
+
+    while True:
+        now = time.monotonic()
+        if now > deadline or best_area.value < 0:
+            break
+        if current == 0:
+            result.width, result.height, result.rects = width, int(width * ratio), packed
+            result.events.append((now - started, result.area))
+            if result.area < best_area.value:
+                best_area.value = result.area
+            width = min(width - max(1, width // 200), widest_target())
+            if width < low:
+                break
+            current, packed = energy(order, rotated)
+            continue
+        if width * int(width * ratio) >= best_area.value:
+            # Another chain found a smaller canvas; chase that one instead
+            width = widest_target()
+            if width < low:
+                break
+            current, packed = energy(order, rotated)
+            continue
+
+        new_order, new_rotated = order, rotated
+        move = rng.random()
+        if move < 0.2 and turnable:
+            i = rng.choice(turnable)
+            new_rotated = list(rotated)
+            new_rotated[i] = not new_rotated[i]
+        elif move < 0.6:
+            i, j = rng.randrange(len(order)), rng.randrange(len(order))
+            new_order = list(order)
+            new_order[i], new_order[j] = new_order[j], new_order[i]
+        else:
+            i, j = rng.randrange(len(order)), rng.randrange(len(order))
+            new_order = list(order)
+            new_order.insert(j, new_order.pop(i))
+
+        candidate, candidate_packed = energy(new_order, new_rotated)
+        fraction = min(1.0, (now - started) / budget)
+        temperature = START_TEMPERATURE * (END_TEMPERATURE / START_TEMPERATURE) ** fraction
+        delta = candidate - current
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            order, rotated = new_order, new_rotated
+            current, packed = candidate, candidate_packed
+
+    return result
+
+
+def _anneal_task(best_area, *args):
+    return anneal(*args[:5], best_area, *args[5:])
+
+
+# Starting states for the chains: the insertion order and rotations of the given layout for
+# its own orientation, largest-first without rotation for the other one.
+def _start_states(layout, rects, ratio):
+    placed_order = [rid for *_, rid in layout.rects]
+    placed_rotated = [False] * len(rects)
+    for rid, _, _, _, _, turned in layout.placements():
+        placed_rotated[rid] = turned
+    by_area = sorted(range(len(rects)), key=lambda i: rects[i][0] * rects[i][1], reverse=True)
+    if layout.orientation == "portrait":
+        return [(ratio, placed_order, placed_rotated), (1 / ratio, by_area, [False] * len(rects))]
+    return [(1 / ratio, placed_order, placed_rotated), (ratio, by_area, [False] * len(rects))]
+
+
+# Spends up to time_budget seconds looking for a smaller canvas than layout, with one
+# annealing chain per worker (alternating orientations, each with its own seed). Always
+# returns a layout: the best one found, or the input if nothing beat it. The returned
+# layout's timeline lists (seconds, unused %) each time the best canvas improved.
+def optimize_layout(
+    layout, ratio, time_budget, workers=None, seed=0, cache=None, progress=None
+):
+    algorithm = layout.strategy.partition("/")[0]
+    key = layout_key(
+        layout.sizes, layout.padding, ratio, f"{algorithm}+anneal@{time_budget:g}s"
+    )
+    entry = cache.get(key) if cache is not None else None
+    if entry is not None:
+        return Layout(
+            entry["canvas_width"],
+            entry["canvas_height"],
+            entry["orientation"],
+            layout.padding,
+            layout.sizes,
+            entry["rects"],
+            cached=True,
+            strategy=entry["strategy"],
+        )
+
+    pack_algo, _ = parse_strategy(f"{algorithm}/SORT_NONE")
+    rects = padded_rects(layout.sizes, layout.padding)
+    low = max(max(min(w, h) for w, h, _ in rects), 1)
+    starts = _start_states(layout, rects, ratio)
+    workers = max(2, workers or DEFAULT_OPTIMIZE_WORKERS)
+    started = time.monotonic()
+    deadline = started + time_budget
+    tasks = []
+    for i in range(workers):
+        r, order, rotated = starts[i % 2]
+        tasks.append((rects, r, pack_algo, order, rotated, started, deadline, seed + i, low))
+
+    def report():
+        elapsed = min(time.monotonic() - started, time_budget)
+        _report(progress, "optimize", int(elapsed), math.ceil(time_budget))
+
+    results = _run_bounded(_anneal_task, tasks, layout.canvas_area, workers, report)
+    if results is None:
+        # No process support: one chain per orientation, one after the other
+        best_area = SimpleNamespace(value=layout.canvas_area)
+        results = []
+        for i, task in enumerate(tasks[:2]):
+            chain_deadline = started + time_budget * (i + 1) / 2
+            results.append(anneal(*task[:5], best_area, started, chain_deadline, *task[7:]))
+            report()
+
+    used = sum(w * h for w, h in layout.sizes)
+    timeline = [(0.0, layout.unused_pct)]
+    best_seen = layout.canvas_area
+    for seconds, area in sorted(event for result in results for event in result.events):
+        if area < best_seen:
+            best_seen = area
+            timeline.append((round(seconds, 3), (area - used) / area * 100))
+
+    best = min(results, key=lambda result: result.area)
+    iterations = sum(result.iterations for result in results)
+    trace_add("optimize", time.monotonic() - started, iterations=iterations)
+    if best.area >= layout.canvas_area:
+        optimized = Layout(
+            layout.canvas_width,
+            layout.canvas_height,
+            layout.orientation,
+            layout.padding,
+            layout.sizes,
+            layout.rects,
+            pack_attempts=layout.pack_attempts + iterations,
+            strategy=layout.strategy,
+            timeline=timeline,
+        )
+    else:
+        optimized = Layout(
+            best.width,
+            best.height,
+            "portrait" if best.ratio == ratio else "landscape",
+            layout.padding,
+            layout.sizes,
+            best.rects,
+            pack_attempts=layout.pack_attempts + iterations,
+            strategy=f"{algorithm}/anneal",
+            timeline=timeline,
+        )
+
+    if cache is not None:
+        cache.put(
+            key,
+            {
+                "canvas_width": optimized.canvas_width,
+                "canvas_height": optimized.canvas_height,
+                "orientation": optimized.orientation,
+                "rects": optimized.rects,
+                "strategy": optimized.strategy,
+            },
+        )
+    return optimized
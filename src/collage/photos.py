@@ -0,0 +1,71 @@
+from typing import NamedTuple
+
+from PIL import Image
+
+EXIF_ORIENTATION = 0x0112
+# Modes Image.reduce() works on; palette, 1-bit and 16-bit images are left to the final resize
+REDUCE_MODES = frozenset({"L", "LA", "RGB", "RGBA", "RGBX", "CMYK", "YCbCr", "I", "F"})
+
+# Transpose that turns a stored image upright for each EXIF orientation value
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+# What packing needs to know about a photo; no pixel data is kept
+class PhotoInfo(NamedTuple):
+    path: str
+    width: int  # as stored in the file
+    height: int
+    orientation: int = 1
+
+    @property
+    def size(self):
+        # Upright size, i.e. after the EXIF orientation has been applied
+        if self.orientation in (5, 6, 7, 8):
+            return self.height, self.width
+        return self.width, self.height
+
+
+# Read dimensions and EXIF orientation from the file header without decoding pixels
+def read_photo_info(path):
+    with Image.open(path) as img:
+        try:
+            orientation = int(img.getexif().get(EXIF_ORIENTATION, 1))
+        except Exception:
+            orientation = 1
+        return PhotoInfo(path, img.width, img.height, orientation)
+
+
+# Decode a photo and turn it upright; the caller owns (and should close) the result.
+# With a target_size (upright w, h) the decoder skips detail that the final resize would
+# throw away: JPEGs are decoded at the smallest DCT scale (1/2, 1/4, 1/8) that still
+# covers the target, other formats are box-reduced by the largest integer factor that does
+# (in the REDUCE_MODES).
+def load_photo(photo, target_size=None):
+    img = Image.open(photo.path)
+    if target_size:
+        target_w, target_h = target_size
+        if photo.orientation in (5, 6, 7, 8):
+            target_w, target_h = target_h, target_w
+        img.draft(img.mode, (target_w, target_h))
+        img.load()
+        factor = min(img.width // target_w, img.height // target_h)
+        if factor >= 2 and img.mode in REDUCE_MODES:
+            reduced = img.reduce(factor)
+            img.close()
+            img = reduced
+    else:
+        img.load()
+    transpose = ORIENTATION_TRANSPOSE.get(photo.orientation)
+    if transpose is None:
+        return img
+    upright = img.transpose(transpose)
+    img.close()
+    return upright
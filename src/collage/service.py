@@ -0,0 +1,451 @@
+import argparse
+import json
+import mimetypes
+import os
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .batch import init_worker, run_batch_job
+from .engine import CollageJob, LayoutError
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Jobs waiting for a worker; submissions beyond this are turned away with 503
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_MAX_UPLOAD_MB = 200
+# Finished jobs whose status is kept (their files stay on disk); the oldest are forgotten
+MAX_FINISHED_JOBS = 1000
+# Finished jobs the queue and run time averages in /status are taken over
+STATS_WINDOW = 100
+MAX_WAIT_SECONDS = 300
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the service's queue is full."""
+
+
+# File name made of letters, digits, "._-" only, with no directory part and no leading dot
+def _safe_name(name):
+    return re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(name or "")).lstrip(".")
+
+
+# Runs on a pool process. Relative photo, logo and profile paths resolve against the
+# service's data directory (so uploads/<name> works). The files go to the job's own
+# directory whatever the submission says: output_name is reduced to a plain file name.
+def _run_service_job(data, base_dir, output_dir, exclusive):
+    job = CollageJob.from_dict(data, base_dir=base_dir)
+    job.output_dir = output_dir
+    job.output_name = _safe_name(job.output_name) or None
+    return run_batch_job(job, exclusive)
+
+
+# Queue of collage jobs in front of a fixed-size process pool. One dispatcher thread per
+# worker takes the next job off the queue and waits for it on the pool, so at most
+# `workers` jobs run at a time and a queued job's wait is measured exactly.
+class CollageService:
+    def __init__(self, data_dir, workers=None, max_queue=DEFAULT_MAX_QUEUE, cache_dir=None):
+        self.data_dir = os.path.abspath(data_dir)
+        self.upload_dir = os.path.join(self.data_dir, "uploads")
+        self.jobs_dir = os.path.join(self.data_dir, "jobs")
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.max_queue = max(1, max_queue)
+        self.cache_dir = cache_dir
+        self.started = time.time()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._jobs = OrderedDict()  # id -> status record, in submission order
+        self._done = {}  # id -> threading.Event set once the job finished
+        # (queue seconds, run seconds) of the latest finished jobs
+        self._recent = deque(maxlen=STATS_WINDOW)
+        self._counts = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "cancelled": 0}
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+        self._dispatchers = [
+            threading.Thread(target=self._dispatch, name=f"collage-dispatch-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._dispatchers:
+            thread.start()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers, initializer=init_worker, initargs=(self.cache_dir,)
+        )
+
+    # Queue a job given as a job file's dict; returns its status record. Raises LayoutError
+    # for settings CollageJob rejects and QueueFull when the queue is full.
+    def submit(self, data):
+        photos = data.get("photos") if isinstance(data, dict) else None
+        if not isinstance(photos, list) or not photos:
+            raise LayoutError("A job needs a non-empty list of photos.")
+        try:
+            CollageJob.from_dict(data, base_dir=self.data_dir)
+        except TypeError as ex:
+            raise LayoutError(f"Invalid job settings: {ex}") from ex
+        job_id = uuid.uuid4().hex[:12]
+        record = {
+            "id": job_id,
+            "state": "queued",
+            "photos": len(data["photos"]),
+            "submitted": time.time(),
+            "queue_seconds": None,
+            "run_seconds": None,
+            "result": None,
+            "error": None,
+        }
+        with self._lock:
+            try:
+                self._queue.put_nowait((job_id, data))
+            except queue.Full:
+                self._counts["rejected"] += 1
+                raise QueueFull(f"The queue is full ({self.max_queue} jobs waiting).") from None
+            self._jobs[job_id] = record
+            self._done[job_id] = threading.Event()
+            self._counts["submitted"] += 1
+            self._forget_old_jobs()
+            return dict(record)
+
+    def _forget_old_jobs(self):
+        finished = [i for i, r in self._jobs.items() if r["state"] in FINISHED_STATES]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+            self._done.pop(job_id, None)
+
+    def _dispatch(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job_id, data = item
+            started = time.perf_counter()
+            try:
+                ran = self._start(job_id, data)
+                if ran is not None:
+                    self._finish(job_id, *ran, time.perf_counter() - started)
+            except Exception as ex:
+                # Whatever goes wrong fails this job, never the dispatcher thread
+                self._finish(job_id, None, str(ex), time.perf_counter() - started)
+
+    # Run a queued job in the pool; returns (result, error), or None if it was cancelled
+    def _start(self, job_id, data):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None or record["state"] != "queued":
+                return None
+            record["queue_seconds"] = round(time.time() - record["submitted"], 3)
+            record["state"] = "running"
+            pool = self._pool
+        output_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            future = pool.submit(
+                _run_service_job, data, self.data_dir, output_dir, self.workers == 1
+            )
+            return future.result(), None
+        except BrokenProcessPool as ex:
+            # A worker died (e.g. out of memory); later jobs get a fresh pool
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = self._new_pool()
+            return None, f"Worker process failed: {ex}"
+        except Exception as ex:
+            return None, str(ex)
+
+    def _finish(self, job_id, result, error, seconds):
+        # Listed first, so a failure here leaves the record to be failed instead
+        files = sorted(os.listdir(os.path.join(self.jobs_dir, job_id))) if result else None
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None or record["state"] not in ("queued", "running"):
+                return
+            record.setdefault("queue_seconds", round(time.time() - record["submitted"], 3))
+            record["state"] = "failed" if error else "done"
+            record["run_seconds"] = round(seconds, 3)
+            record["error"] = error
+            if result is not None:
+                record["result"] = result
+                record["files"] = files
+            self._counts[record["state"]] += 1
+            self._recent.append((record["queue_seconds"], record["run_seconds"]))
+            self._done[job_id].set()
+
+    # Cancel a job that has not started yet; returns its record, or None if unknown
+    def cancel(self, job_id):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None:
+                return None
+            if record["state"] == "queued":
+                record["state"] = "cancelled"
+                self._counts["cancelled"] += 1
+                self._done[job_id].set()
+            return dict(record)
+
+    # Status record of a job, or None if unknown. With wait, blocks up to that many
+    # seconds for the job to finish first.
+    def status(self, job_id, wait=0):
+        with self._lock:
+            done = self._done.get(job_id)
+        if done is None:
+            return None
+        if wait > 0:
+            done.wait(min(wait, MAX_WAIT_SECONDS))
+        with self._lock:
+            record = self._jobs.get(job_id)
+            return dict(record) if record is not None else None
+
+    def jobs(self):
+        with self._lock:
+            return [
+                {key: record[key] for key in ("id", "state", "photos", "submitted")}
+                for record in self._jobs.values()
+            ]
+
+    # Path of one of a finished job's files, or None
+    def job_file(self, job_id, name):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            files = record.get("files", ()) if record is not None else ()
+        if name not in files:
+            return None
+        return os.path.join(self.jobs_dir, job_id, name)
+
+    # Store an uploaded photo; returns the path to use for it in a job's photos
+    def save_upload(self, name, stream, length):
+        base = _safe_name(name) or "photo"
+        relative = f"uploads/{uuid.uuid4().hex[:12]}_{base}"
+        path = os.path.join(self.data_dir, relative)
+        remaining = length
+        with open(path, "wb") as f:
+            while remaining > 0:
+                chunk = stream.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            os.remove(path)
+            raise LayoutError("The upload ended early.")
+        return relative
+
+    def stats(self):
+        with self._lock:
+            states = [record["state"] for record in self._jobs.values()]
+            recent = list(self._recent)
+            counts = dict(self._counts)
+        uptime = time.time() - self.started
+
+        def mean(values):
+            return round(sum(values) / len(values), 3) if values else None
+
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queued": states.count("queued"),
+            "running": states.count("running"),
+            **counts,
+            "uptime_seconds": round(uptime, 1),
+            "jobs_per_minute": round(counts["done"] * 60 / uptime, 2) if uptime else 0.0,
+            "mean_queue_seconds": mean([q for q, _ in recent]),
+            "mean_run_seconds": mean([r for _, r in recent]),
+            "max_run_seconds": max((r for _, r in recent), default=None),
+        }
+
+    # Jobs still queued are cancelled; running ones are waited for only with wait
+    def shutdown(self, wait=True):
+        with self._lock:
+            while True:
+                try:
+                    job_id, _ = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                record = self._jobs.get(job_id)
+                if record is not None and record["state"] == "queued":
+                    record["state"] = "cancelled"
+                    self._counts["cancelled"] += 1
+                    self._done[job_id].set()
+        for _ in self._dispatchers:
+            try:
+                self._queue.put(None, block=wait)
+            except queue.Full:
+                break
+        if wait:
+            for thread in self._dispatchers:
+                thread.join()
+        self._pool.shutdown(wait=wait)
+
+
+# HTTP front end of a CollageService (server.service):
+#   POST   /uploads?name=a.jpg   raw photo bytes -> {"path": "uploads/..."}
+#   POST   /jobs                 job file JSON   -> 202 with the job's status, 503 if full
+#   GET    /jobs                 all known jobs
+#   GET    /jobs/<id>[?wait=s]   status, with the run_job result once done
+#   GET    /jobs/<id>/files/<f>  one of the job's files (print file, preview, layout JSON)
+#   DELETE /jobs/<id>            cancel a queued job
+#   GET    /status               queue, worker and throughput figures
+class CollageRequestHandler(BaseHTTPRequestHandler):
+    server_version = "CollageService/1"
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, headers=None):
+        self._send_json(status, {"error": message}, headers)
+
+    def _route(self):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+        return parts, parse_qs(url.query)
+
+    def _content_length(self):
+        try:
+            return int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        service = self.server.service
+        parts, query = self._route()
+        if parts == ["status"]:
+            return self._send_json(200, service.stats())
+        if parts == ["jobs"]:
+            return self._send_json(200, {"jobs": service.jobs()})
+        if len(parts) == 2 and parts[0] == "jobs":
+            try:
+                wait = float(query.get("wait", ["0"])[0])
+            except ValueError:
+                return self._error(400, "wait must be a number of seconds.")
+            record = service.status(parts[1], wait)
+            if record is None:
+                return self._error(404, "Unknown job.")
+            return self._send_json(200, record)
+        if len(parts) == 4 and parts[0] == "jobs" and parts[2] == "files":
+            path = service.job_file(parts[1], parts[3])
+            if path is None:
+                return self._error(404, "Unknown job or file.")
+            size = os.path.getsize(path)
+            self.send_response(200)
+            self.send_header(
+                "Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream"
+            )
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+            return None
+        return self._error(404, "Not found.")
+
+    def do_POST(self):
+        service = self.server.service
+        parts, query = self._route()
+        length = self._content_length()
+        if length is None:
+            return self._error(411, "Content-Length is required.")
+        if parts == ["uploads"]:
+            if length > self.server.max_upload_bytes:
+                return self._error(413, "The photo is too large.")
+            try:
+                path = service.save_upload(query.get("name", [""])[0], self.rfile, length)
+            except LayoutError as ex:
+                return self._error(400, str(ex))
+            return self._send_json(201, {"path": path})
+        if parts == ["jobs"]:
+            try:
+                data = json.loads(self.rfile.read(length) or b"null")
+                record = service.submit(data)
+            except (ValueError, LayoutError) as ex:
+                return self._error(400, str(ex))
+            except QueueFull as ex:
+                return self._error(503, str(ex), {"Retry-After": "5"})
+            return self._send_json(202, record, {"Location": f"/jobs/{record['id']}"})
+        return self._error(404, "Not found.")
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == "jobs":
+            record = self.server.service.cancel(parts[1])
+            if record is None:
+                return self._error(404, "Unknown job.")
+            return self._send_json(200, record)
+        return self._error(404, "Not found.")
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, max_upload_mb=DEFAULT_MAX_UPLOAD_MB):
+    server = ThreadingHTTPServer((host, port), CollageRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.max_upload_bytes = max_upload_mb * 1024 * 1024
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m collage.service",
+        description="Serve collage jobs over HTTP from a queue and a fixed pool of worker "
+        "processes.",
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"default: {DEFAULT_HOST}")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"default: {DEFAULT_PORT}")
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="jobs rendered at the same time (default: all cores)",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=DEFAULT_MAX_QUEUE,
+        help=f"jobs allowed to wait for a worker (default: {DEFAULT_MAX_QUEUE})",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=os.path.join(tempfile.gettempdir(), "collage-service"),
+        help="where uploads and job outputs are kept; relative photo paths resolve against it",
+    )
+    parser.add_argument("--cache-dir", help="directory for packings shared between jobs")
+    parser.add_argument(
+        "--max-upload-mb", type=int, default=DEFAULT_MAX_UPLOAD_MB, help="largest photo accepted"
+    )
+    args = parser.parse_args(argv)
+
+    service = CollageService(args.data_dir, args.workers, args.max_queue, args.cache_dir)
+    server = make_server(service, args.host, args.port, args.max_upload_mb)
+    print(
+        f"Serving collage jobs on http://{args.host}:{server.server_port} with "
+        f"{service.workers} workers; data in '{service.data_dir}'.",
+        file=sys.stderr,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown(wait=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
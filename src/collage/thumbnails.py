@@ -0,0 +1,243 @@
+import base64
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from .engine import DEFAULT_RENDER_WORKERS, image_to_base64
+from .photos import PhotoInfo, load_photo
+
+THUMBNAIL_SIZE = 150
+PROXY_SIZE = 1024
+DEFAULT_PROXY_CACHE_BYTES = 512 * 1024**2
+DEFAULT_PROXY_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "efficient_photo_collage", "proxies"
+)
+
+
+# Small upright JPEG of a photo that fits in a size x size box
+def make_thumbnail(photo, size=THUMBNAIL_SIZE):
+    width, height = photo.size
+    scale = min(1.0, size / max(width, height))
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    with load_photo(photo, target) as img:
+        thumbnail = img.convert("RGB").resize(target, Image.Resampling.LANCZOS)
+    return thumbnail
+
+
+def _jpeg_bytes(image, quality=85):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+# Content-addressed store of list thumbnails and mid-size render proxies. Entries are
+# keyed by the SHA-1 of the file contents plus its mtime, so the same photo brought back
+# in a later session (even from another folder) is never decoded again. The directory
+# is capped at max_bytes; the least recently used files are deleted first.
+class ProxyCache:
+    def __init__(
+        self,
+        directory=DEFAULT_PROXY_CACHE_DIR,
+        max_bytes=DEFAULT_PROXY_CACHE_BYTES,
+        proxy_size=PROXY_SIZE,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.proxy_size = proxy_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._digests = {}
+        # file name -> size in bytes, oldest access first
+        self._files = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+        self._total = sum(self._files.values())
+        with self._lock:
+            self._evict()
+
+    def key_for(self, photo):
+        stat = os.stat(photo.path)
+        memo_key = (photo.path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(memo_key)
+        if digest is None:
+            sha1 = hashlib.sha1()
+            with open(photo.path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha1.update(chunk)
+            digest = sha1.hexdigest()
+            with self._lock:
+                self._digests[memo_key] = digest
+        return f"{digest}-{stat.st_mtime_ns}"
+
+    # JPEG bytes of the photo's thumbnail in a size x size box
+    def thumbnail(self, photo, size=THUMBNAIL_SIZE):
+        name = f"{self.key_for(photo)}_t{size}.jpg"
+        data = self._read(name)
+        if data is None:
+            data = _jpeg_bytes(make_thumbnail(photo, size))
+            self._write(name, data)
+        return data
+
+    def _proxy_entry(self, photo):
+        width, height = photo.size
+        scale = min(1.0, self.proxy_size / max(width, height))
+        if scale == 1.0:
+            return None, None
+        name = f"{self.key_for(photo)}_p{self.proxy_size}.jpg"
+        return name, (round(width * scale), round(height * scale))
+
+    # Write the proxy JPEG of a photo unless it is cached already. Photos no larger than
+    # the proxy size get none; they are as cheap to decode as a proxy would be.
+    def make_proxy(self, photo):
+        name, size = self._proxy_entry(photo)
+        if name is None or self._read(name, load=False) is not None:
+            return
+        with load_photo(photo, size) as img:
+            proxy = img.convert("RGB").resize(size, Image.Resampling.LANCZOS)
+        self._write(name, _jpeg_bytes(proxy, quality=92))
+
+    # Thumbnails and proxies for several photos, generated in parallel
+    def warm(self, photos, thumbnail_size=THUMBNAIL_SIZE, workers=None):
+        def build(photo):
+            self.thumbnail(photo, thumbnail_size)
+            self.make_proxy(photo)
+
+        with ThreadPoolExecutor(max_workers=workers or DEFAULT_RENDER_WORKERS) as pool:
+            list(pool.map(build, photos))
+
+    # What to decode for a photo that ends up w x h (upright) on a preview: its cached
+    # proxy (stored upright, so orientation 1) if that is at least as large, else the original
+    def source_for(self, photo, size):
+        name, proxy_size = self._proxy_entry(photo)
+        if name is None or size[0] > proxy_size[0] or size[1] > proxy_size[1]:
+            return photo
+        if self._read(name, load=False) is None:
+            return photo
+        return PhotoInfo(os.path.join(self.directory, name), *proxy_size)
+
+    def clear(self):
+        with self._lock:
+            for name in self._files:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            self._files.clear()
+            self._total = 0
+
+    def __len__(self):
+        return len(self._files)
+
+    @property
+    def total_bytes(self):
+        return self._total
+
+    def _read(self, name, load=True):
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            known = name in self._files
+            if known:
+                self._files.move_to_end(name)
+        if not known:
+            self.misses += 1
+            return None
+        try:
+            if load:
+                with open(path, "rb") as f:
+                    data = f.read()
+            else:
+                data = b""
+            os.utime(path)
+        except OSError:
+            # Deleted behind our back, e.g. by another session sharing the directory
+            with self._lock:
+                self._total -= self._files.pop(name, 0)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def _write(self, name, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self._total += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock; the newest file stays even if it alone is over the cap
+        while self._total > self.max_bytes and len(self._files) > 1:
+            old_name, old_size = self._files.popitem(last=False)
+            self._total -= old_size
+            try:
+                os.remove(os.path.join(self.directory, old_name))
+            except OSError:
+                pass
+
+
+# In-memory LRU of base64 thumbnails for the photo list, keyed by path and box size.
+# With a ProxyCache behind it, misses are served from disk before anything is decoded.
+class ThumbnailCache:
+    def __init__(self, max_entries=2000, size=THUMBNAIL_SIZE, store=None):
+        self.max_entries = max_entries
+        self.size = size
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, photo):
+        key = (photo.path, self.size)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        if self.store is not None:
+            data = base64.b64encode(self.store.thumbnail(photo, self.size)).decode("ascii")
+        else:
+            data = image_to_base64(make_thumbnail(photo, self.size), "JPEG")
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+    # Generate the missing thumbnails of several photos in parallel
+    def warm(self, photos, workers=None):
+        with self._lock:
+            missing = [p for p in photos if (p.path, self.size) not in self._entries]
+        if len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=workers or DEFAULT_RENDER_WORKERS) as pool:
+                list(pool.map(self.get, missing))
+        elif missing:
+            self.get(missing[0])
+
+    def discard(self, photo):
+        with self._lock:
+            self._entries.pop((photo.path, self.size), None)
@@ -0,0 +1,200 @@
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# TIFF field types
+SHORT = 3
+LONG = 4
+UNDEFINED = 7
+LONG8 = 16
+
+_TYPE_FORMATS = {SHORT: "H", LONG: "I", UNDEFINED: "B", LONG8: "Q"}
+
+ICC_PROFILE_TAG = 34675
+
+COMPRESSION_NONE = 1
+COMPRESSION_DEFLATE = 8
+
+_PHOTOMETRIC = {"RGB": 2, "CMYK": 5, "L": 1}
+
+# Classic TIFF offsets are 32 bit; switch to BigTIFF well before the file could outgrow them
+BIGTIFF_THRESHOLD = 3 * 1024**3
+
+
+# Writes a striped TIFF one band of rows at a time, so the full image never has to be in memory.
+# Strips are appended as they arrive and the directory is written at the end of the file.
+# With tile_size (a multiple of 16) the image is stored as tile_size x tile_size tiles
+# instead; every band but the last must then be exactly tile_size rows high. workers > 1
+# deflates the tiles of a band on a thread pool (zlib releases the GIL).
+class StripTiffWriter:
+    def __init__(
+        self,
+        path,
+        width,
+        height,
+        mode="RGB",
+        compression="deflate",
+        bigtiff=None,
+        icc_profile=None,
+        tile_size=None,
+        workers=None,
+    ):
+        if mode not in _PHOTOMETRIC:
+            raise ValueError(f"Unsupported TIFF mode: {mode}")
+        if tile_size is not None and (tile_size <= 0 or tile_size % 16):
+            raise ValueError("TIFF tile size must be a positive multiple of 16.")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.samples = len(mode)
+        self.compression = COMPRESSION_DEFLATE if compression == "deflate" else COMPRESSION_NONE
+        if bigtiff is None:
+            bigtiff = width * height * self.samples >= BIGTIFF_THRESHOLD
+        self.bigtiff = bigtiff
+        self.icc_profile = icc_profile
+        self.tile_size = tile_size
+        self.rows_per_strip = tile_size
+        self.rows_written = 0
+        self.encode_seconds = 0.0  # spent compressing and writing pixel data
+        self._pool = ThreadPoolExecutor(max_workers=workers) if (workers or 1) > 1 else None
+        self._offsets = []
+        self._byte_counts = []
+        self._file = open(path, "wb")
+        if bigtiff:
+            self._file.write(b"II+\x00" + struct.pack("<HHQ", 8, 0, 0))
+        else:
+            self._file.write(b"II*\x00" + struct.pack("<I", 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._shutdown()
+            self._file.close()
+
+    def _shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _compress(self, data):
+        if self.compression == COMPRESSION_DEFLATE:
+            return zlib.compress(data, 6)
+        return data
+
+    def write_band(self, band):
+        # Every band but the last must have the same height; it becomes RowsPerStrip
+        if band.mode != self.mode or band.width != self.width:
+            raise ValueError("Band does not match the TIFF image width or mode.")
+        if self.rows_per_strip is None:
+            self.rows_per_strip = band.height
+        elif self.rows_written % self.rows_per_strip or band.height > self.rows_per_strip:
+            raise ValueError("Only the last band may be shorter than the others.")
+        started = time.perf_counter()
+        if self.tile_size:
+            # Edge tiles are padded to full size; readers crop them to the image
+            size = self.tile_size
+            padded = Image.new(self.mode, (-(-self.width // size) * size, size))
+            padded.paste(band, (0, 0))
+            chunks = [
+                padded.crop((x, 0, x + size, size)).tobytes()
+                for x in range(0, padded.width, size)
+            ]
+        else:
+            chunks = [band.tobytes()]
+        if self._pool is not None:
+            chunks = self._pool.map(self._compress, chunks)
+        else:
+            chunks = map(self._compress, chunks)
+        for data in chunks:
+            self._offsets.append(self._file.tell())
+            self._byte_counts.append(len(data))
+            self._file.write(data)
+        self.rows_written += band.height
+        self.encode_seconds += time.perf_counter() - started
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self.rows_written != self.height:
+            self._file.close()
+            raise ValueError(f"Wrote {self.rows_written} of {self.height} rows.")
+        self._shutdown()
+        offset_type = LONG8 if self.bigtiff else LONG
+        entries = [
+            (256, LONG, [self.width]),
+            (257, LONG, [self.height]),
+            (258, SHORT, [8] * self.samples),
+            (259, SHORT, [self.compression]),
+            (262, SHORT, [_PHOTOMETRIC[self.mode]]),
+            (277, SHORT, [self.samples]),
+            (284, SHORT, [1]),
+        ]
+        if self.tile_size:
+            entries += [
+                (322, LONG, [self.tile_size]),
+                (323, LONG, [self.tile_size]),
+                (324, offset_type, self._offsets),
+                (325, offset_type, self._byte_counts),
+            ]
+        else:
+            entries += [
+                (273, offset_type, self._offsets),
+                (278, LONG, [self.rows_per_strip or self.height]),
+                (279, offset_type, self._byte_counts),
+            ]
+        if self.mode == "CMYK":
+            entries.append((332, SHORT, [1]))
+        if self.icc_profile:
+            entries.append((ICC_PROFILE_TAG, UNDEFINED, self.icc_profile))
+        # Readers expect the directory entries in ascending tag order
+        entries.sort(key=lambda entry: entry[0])
+        started = time.perf_counter()
+        self._write_ifd(entries)
+        self._file.close()
+        self.encode_seconds += time.perf_counter() - started
+
+    def _write_ifd(self, entries):
+        f = self._file
+        if f.tell() % 2:
+            f.write(b"\x00")
+        ifd_offset = f.tell()
+        if self.bigtiff:
+            count_fmt, entry_fmt, inline_size, next_fmt = "<Q", "<HHQ", 8, "<Q"
+        else:
+            count_fmt, entry_fmt, inline_size, next_fmt = "<H", "<HHI", 4, "<I"
+        entry_size = struct.calcsize(entry_fmt) + inline_size
+        # Values that do not fit inline go right after the directory
+        data_offset = (
+            ifd_offset
+            + struct.calcsize(count_fmt)
+            + entry_size * len(entries)
+            + struct.calcsize(next_fmt)
+        )
+        ifd = [struct.pack(count_fmt, len(entries))]
+        extra = []
+        for tag, field_type, values in entries:
+            if isinstance(values, bytes):
+                data = values
+            else:
+                data = struct.pack(f"<{len(values)}{_TYPE_FORMATS[field_type]}", *values)
+            ifd.append(struct.pack(entry_fmt, tag, field_type, len(values)))
+            if len(data) <= inline_size:
+                ifd.append(data.ljust(inline_size, b"\x00"))
+            else:
+                ifd.append(struct.pack(next_fmt, data_offset))
+                extra.append(data)
+                data_offset += len(data)
+        ifd.append(struct.pack(next_fmt, 0))
+        f.write(b"".join(ifd + extra))
+
+        # Point the header at the directory
+        f.seek(8 if self.bigtiff else 4)
+        f.write(struct.pack(next_fmt, ifd_offset))
@@ -0,0 +1,129 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+_current = contextvars.ContextVar("collage_trace", default=None)
+
+# How stage counters read in the one-line summary
+SUMMARY_COUNTERS = {
+    "pack_attempts": "packs",
+    "photos": "photos",
+    "sheets": "sheets",
+    "sizes_tried": "font sizes",
+    "iterations": "iterations",
+    "grid_columns": "column counts",
+}
+
+
+# Durations and counters of one generate run, stage by stage. A trace is made current with
+# activate(); the engine records into the current trace (if any) through traced(), so
+# runs without one pay nothing. Stages that run on several threads add up their time.
+class RunTrace:
+    def __init__(self, name=None):
+        self.name = name
+        self.created = datetime.now().isoformat(timespec="seconds")
+        self.stages = {}  # name -> {"seconds", "calls", counters...}, in first-seen order
+        self.values = {}  # run-wide facts such as the canvas size
+        self._started = time.perf_counter()
+        self._finished = None
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, **counters):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+            for key, value in counters.items():
+                entry[key] = entry.get(key, 0) + value
+
+    def set(self, **values):
+        with self._lock:
+            self.values.update(values)
+
+    # Times the block as one call of stage; counters put into the yielded dict are added
+    @contextmanager
+    def stage(self, name, **counters):
+        started = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            self.add(name, time.perf_counter() - started, **counters)
+
+    @contextmanager
+    def activate(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def finish(self):
+        self._finished = time.perf_counter()
+
+    @property
+    def total_seconds(self):
+        return (self._finished or time.perf_counter()) - self._started
+
+    def summary(self):
+        parts = []
+        for name, entry in self.stages.items():
+            counts = [
+                f"{entry[key]} {label}" for key, label in SUMMARY_COUNTERS.items() if entry.get(key)
+            ]
+            note = f" ({', '.join(counts)})" if counts else ""
+            parts.append(f"{name} {entry['seconds']:.2f} s{note}")
+        return f"{', '.join(parts)}; {self.total_seconds:.1f} s in all"
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "created": self.created,
+                "total_seconds": round(self.total_seconds, 4),
+                "values": dict(self.values),
+                "stages": {
+                    name: {k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()}
+                    for name, entry in self.stages.items()
+                },
+            }
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def current_trace():
+    return _current.get()
+
+
+# traced("search") times its block into the current trace; without one it only yields a
+# scratch dict for the counters
+@contextmanager
+def traced(stage, **counters):
+    trace = _current.get()
+    if trace is None:
+        yield counters
+        return
+    with trace.stage(stage, **counters) as counts:
+        yield counts
+
+
+def trace_values(**values):
+    trace = _current.get()
+    if trace is not None:
+        trace.set(**values)
+
+
+# pool.submit(fn, *args) with the caller's trace still current on the worker thread
+def submit_traced(pool, fn, *args, **kwargs):
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# Adds a stage timed elsewhere (e.g. by a writer that keeps its own clock) to the current trace
+def trace_add(stage, seconds, **counters):
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds, **counters)
@@ -1,12 +1,42 @@
-import math
 import os
 import platform
 import subprocess
-from datetime import datetime
+import time
 
 import flet as ft
-from PIL import Image, ImageDraw, ImageFont
-from rectpack import newPacker
+from collage import (
+    DEFAULT_DPI,
+    DEFAULT_OPTIMIZE_SECONDS,
+    DEFAULT_PORTFOLIO_TIME_BUDGET,
+    INCREMENTAL_SUFFIX,
+    OUTPUT_PROFILES,
+    PACK_PORTFOLIO,
+    PAPER_RATIOS,
+    PAPER_SIZES_MM,
+    TRACE_SUFFIX,
+    BackgroundWriter,
+    LayoutError,
+    LayoutJobRunner,
+    PackingCache,
+    ProxyCache,
+    RunTrace,
+    ThumbnailCache,
+    branding_overlay,
+    compute_layout,
+    grid_layout,
+    image_to_base64,
+    optimize_layout,
+    pack_sheets,
+    parse_ratio,
+    read_photo_info,
+    render_preview,
+    render_sheets,
+    render_sheets_preview,
+    render_to_file,
+    scaled_sizes,
+    sheet_size,
+    update_layout,
+)
 
 
 def main(page: ft.Page):
@@ -19,24 +49,69 @@ def main(page: ft.Page):
     page.window.width = 1400
     page.update()
 
-    # Lists to hold loaded images, their file paths, and scaling factors
-    images = []
-    file_paths = []
+    # Lists to hold photo records (path, size, orientation; no pixels) and scaling factors
+    photos = []
     scale_factors = []
     area_percentages = []
+    selected = []
     last_output_path = [None]
+    # (layout, photo paths, unused % of the last full search, packing strategies searched)
+    # of the last generated collage
+    previous_layout = [None]
     logo_path = [os.path.join("assets", "icon.png")]
     custom_logo_path = [None]
     save_directory = [os.getcwd()]  # Default to current working directory
+    # Packings already computed this session; cosmetic changes re-render without repacking
+    packing_cache = PackingCache(max_entries=16)
+    # Thumbnails and preview proxies kept on disk across sessions, keyed by file content
+    try:
+        proxy_cache = ProxyCache()
+    except OSError:
+        proxy_cache = None
 
     # Status text
     status = ft.Text("No photos selected yet!", size=14)
+    # Where the time of the last run went, stage by stage
+    timing = ft.Text("", size=12, color=ft.Colors.GREY_700)
 
     # Checkbox for CMYK mode
     cmyk_mode = ft.Checkbox(
         label="CMYK color profile - use it for printing (saves as TIFF)", value=False
     )
 
+    # Checkbox for trying several packing algorithms and keeping the smallest canvas
+    portfolio_mode = ft.Checkbox(
+        label=f"Try {len(PACK_PORTFOLIO)} packing algorithms "
+        f"(up to {DEFAULT_PORTFOLIO_TIME_BUDGET:g} s more, often a smaller canvas)",
+        value=False,
+    )
+
+    # Checkbox for spending extra time on a tighter layout (high-value print jobs)
+    optimize_mode = ft.Checkbox(
+        label=f"Keep optimizing the layout for {DEFAULT_OPTIMIZE_SECONDS:g} s to save paper",
+        value=False,
+    )
+
+    # Dropdown for the print file format; "auto" keeps PNG, or TIFF in CMYK mode
+    output_format_dropdown = ft.Dropdown(
+        label="Print file format",
+        options=[ft.dropdown.Option("auto", text="Automatic (PNG / CMYK TIFF)")]
+        + [ft.dropdown.Option(name) for name in OUTPUT_PROFILES],
+        value="auto",
+        width=250,
+    )
+
+    # Checkbox for editing the last arrangement in place instead of packing from scratch
+    incremental_mode = ft.Checkbox(
+        label="Keep the current arrangement when photos are added, removed or resized",
+        value=True,
+    )
+
+    # Checkbox for keeping the stage timings of every run as JSON beside the print file
+    trace_enabled = ft.Checkbox(
+        label=f"Save a timing trace ({TRACE_SUFFIX}) next to the print file", value=False
+    )
+
     # Checkbox and input for padding
     padding_enabled = ft.Checkbox(
         label="White border between photos for easier cutting", value=False
@@ -127,29 +202,12 @@ def main(page: ft.Page):
     watermark_enabled.on_change = on_watermark_toggle
 
     # Paper ratio selection
-    paper_ratios = {
-        "A Series": math.sqrt(2),
-        "B Series": 1.0 / math.sqrt(2),
-        "C Series": 1.0 / math.sqrt(2),
-        "Letter": 11.0 / 8.5,
-        "Custom ratio": None,
-    }
+    paper_ratios = {**PAPER_RATIOS, "Custom ratio": None}
     current_ratio = paper_ratios["A Series"]
     custom_ratio = ft.TextField(
         label="Custom Ratio (e.g., 5:7 or 1.4286)", value="", width=150, visible=False
     )
 
-    def parse_ratio(ratio_str):
-        if not ratio_str:
-            return 1.0
-        try:
-            if ":" in ratio_str:
-                width, height = map(float, ratio_str.split(":"))
-                return height / width if width > 0 else 1.0
-            return float(ratio_str)
-        except ValueError:
-            return 1.0
-
     def update_ratio(e):
         nonlocal current_ratio
         selected_ratio = paper_ratio_dropdown.value
@@ -188,6 +246,38 @@ def main(page: ft.Page):
         width=140,
     )
 
+    # Fixed paper sheets: pack onto as many A4/A3/... sheets at the given DPI as needed
+    # instead of one canvas sized to fit
+    sheet_dpi = ft.TextField(label="DPI", value=str(DEFAULT_DPI), width=80, visible=False)
+
+    def on_sheet_paper_change(e):
+        sheet_dpi.visible = (
+            sheet_paper_dropdown.value != "canvas" or layout_mode_dropdown.value == "grid"
+        )
+        page.update()
+
+    sheet_paper_dropdown = ft.Dropdown(
+        label="Print on",
+        options=[ft.dropdown.Option("canvas", text="One canvas")]
+        + [ft.dropdown.Option(paper, text=f"{paper} sheets") for paper in PAPER_SIZES_MM],
+        value="canvas",
+        on_change=on_sheet_paper_change,
+        width=150,
+    )
+
+    # Layout mode: the packer's smallest canvas, or a quick uniform grid on one sheet of the
+    # "Print on" paper (A4 when printing on one canvas)
+    layout_mode_dropdown = ft.Dropdown(
+        label="Layout",
+        options=[
+            ft.dropdown.Option("pack", text="Packed (least waste)"),
+            ft.dropdown.Option("grid", text="Grid (fast)"),
+        ],
+        value="pack",
+        on_change=on_sheet_paper_change,
+        width=180,
+    )
+
     # List view for uploaded photo previews
     def get_list_params():
         screen_width = page.width
@@ -198,7 +288,133 @@ def main(page: ft.Page):
         return 150
 
     photo_size = get_list_params()
-    photo_list = ft.ListView(expand=True, spacing=10, padding=15, auto_scroll=True)
+
+    # Rows are fixed-height slots. A slot only gets its controls and thumbnail while it is on
+    # screen or near it, and edits push just the rows they touched instead of the whole page.
+    row_margin = 10
+    first_row = 0  # first row in view, as of the last scroll
+    thumbnails = ThumbnailCache(store=proxy_cache)
+    live_slots = set()
+
+    def row_extent():
+        return photo_size + 30
+
+    def rows_per_view():
+        return int(page.height * 0.4 // row_extent()) + 1
+
+    def scale_label(i):
+        scale_pct = int((scale_factors[i] - 1.0) * 100)
+        scale_color = ft.Colors.GREEN if scale_factors[i] >= 1.0 else ft.Colors.RED
+        return f"Scale: {scale_pct}%", scale_color
+
+    def on_row_checked(e):
+        selected[e.control.data.data] = e.control.value
+
+    def build_row(slot):
+        i = slot.data
+        photo = photos[i]
+        width, height = photo.size
+        scale_text, scale_color = scale_label(i)
+        return ft.Column([
+            ft.Row([
+                ft.Checkbox(label="", value=selected[i], data=slot, on_change=on_row_checked),
+                ft.Image(
+                    src_base64=thumbnails.get(photo),
+                    width=photo_size,
+                    height=photo_size,
+                    fit=ft.ImageFit.CONTAIN,
+                    border_radius=5,
+                ),
+                ft.Text(
+                    os.path.basename(photo.path),
+                    size=12,
+                    width=150,
+                    text_align=ft.TextAlign.LEFT,
+                ),
+                ft.Text(
+                    f"{width}x{height}",
+                    size=12,
+                    width=100,
+                    text_align=ft.TextAlign.CENTER,
+                ),
+                ft.Text(
+                    f"Area: {area_percentages[i]:.2f}%",
+                    size=12,
+                    width=100,
+                    text_align=ft.TextAlign.CENTER,
+                ),
+                ft.Text(
+                    value=scale_text,
+                    size=12,
+                    color=scale_color,
+                    width=100,
+                    text_align=ft.TextAlign.CENTER,
+                ),],
+                alignment=ft.MainAxisAlignment.START,
+                spacing=10,
+            ),
+            ft.Divider(),
+        ])
+
+    # Refresh the labels of a row that is on screen; returns the slot to push, if any
+    def refresh_row(i):
+        slot = photo_list.controls[i]
+        if slot.content is None:
+            return None
+        row = slot.content.controls[0]
+        scale_text, scale_color = scale_label(i)
+        row.controls[0].value = selected[i]
+        row.controls[4].value = f"Area: {area_percentages[i]:.2f}%"
+        row.controls[5].value = scale_text
+        row.controls[5].color = scale_color
+        return slot
+
+    def refresh_live_rows():
+        return [refresh_row(slot.data) for slot in live_slots]
+
+    # Give rows first..last (plus a margin) their controls and empty the rows far away
+    def show_rows(first, last):
+        first = max(0, first - row_margin)
+        last = min(len(photo_list.controls), last + row_margin)
+        changed = []
+        for slot in list(live_slots):
+            if not first <= slot.data < last:
+                slot.content = None
+                live_slots.discard(slot)
+                changed.append(slot)
+        new_slots = [slot for slot in photo_list.controls[first:last] if slot.content is None]
+        thumbnails.warm([photos[slot.data] for slot in new_slots])
+        for slot in new_slots:
+            slot.content = build_row(slot)
+            live_slots.add(slot)
+            changed.append(slot)
+        return changed
+
+    def push_rows(*controls):
+        controls = [ctrl for ctrl in controls if ctrl is not None]
+        if controls:
+            page.update(*controls)
+
+    # Rows for the current scroll position, after the list or the window changed size
+    def show_visible_rows():
+        nonlocal first_row
+        first_row = max(0, min(first_row, len(photo_list.controls) - rows_per_view()))
+        return show_rows(first_row, first_row + rows_per_view())
+
+    def on_photo_list_scroll(e: ft.OnScrollEvent):
+        nonlocal first_row
+        first_row = int(e.pixels // row_extent())
+        push_rows(*show_rows(first_row, first_row + rows_per_view()))
+
+    photo_list = ft.ListView(
+        expand=True,
+        spacing=0,
+        padding=15,
+        auto_scroll=True,
+        item_extent=row_extent(),
+        on_scroll=on_photo_list_scroll,
+        on_scroll_interval=100,
+    )
 
     # Image control for previewing the final collage
     def open_collage(e):
@@ -216,7 +432,8 @@ def main(page: ft.Page):
                 status.value = f"Error opening collage: {str(ex)}"
             page.update()
         else:
-            status.value = "No collage generated yet."
+            status.value = "No collage saved yet."
+            page.update()
 
     collage_preview = ft.Image(
         src="",
@@ -235,82 +452,47 @@ def main(page: ft.Page):
 
     # File picker handlers
     def handle_photo_upload(e: ft.FilePickerResultEvent):
+        nonlocal first_row
         if e.files:
-            if not images:
-                images.clear()
-                file_paths.clear()
+            if not photos:
+                photos.clear()
                 scale_factors.clear()
                 area_percentages.clear()
+                selected.clear()
                 photo_list.controls.clear()
+                live_slots.clear()
             added_count = 0
+            known_paths = {photo.path for photo in photos}
             for f in e.files:
-                if f.path in file_paths:
+                if f.path in known_paths:
                     continue
                 if not f.path.lower().endswith(('.jpg', '.jpeg', '.png')):
                     status.value = f"Skipped {f.name}: Only JPG and PNG files are supported."
                     continue
                 try:
-                    img = Image.open(f.path)
-                    if cmyk_mode.value:
-                        img = img.convert("CMYK")
-                    images.append(img)
-                    file_paths.append(f.path)
-                    scale_factors.append(1.0)
-                    area_percentages.append(0.0)
-                    scale_pct = 0
-                    scale_color = ft.Colors.BLACK
-                    file_name = os.path.basename(f.path)
-                    dimensions = f"{img.width}x{img.height}"
-                    photo_list.controls.append(
-                        ft.Column([
-                            ft.Row([
-                                ft.Checkbox(label=""),
-                                ft.Image(
-                                    src=f.path,
-                                    width=photo_size,
-                                    height=photo_size,
-                                    fit=ft.ImageFit.CONTAIN,
-                                    border_radius=5,
-                                ),
-                                ft.Text(
-                                    file_name,
-                                    size=12,
-                                    width=150,
-                                    text_align=ft.TextAlign.LEFT,
-                                ),
-                                ft.Text(
-                                    dimensions,
-                                    size=12,
-                                    width=100,
-                                    text_align=ft.TextAlign.CENTER,
-                                ),
-                                ft.Text(
-                                    "Area: 0.00%",
-                                    size=12,
-                                    width=100,
-                                    text_align=ft.TextAlign.CENTER,
-                                ),
-                                ft.Text(
-                                    value=f"Scale: {scale_pct}%",
-                                    size=12,
-                                    color=scale_color,
-                                    width=100,
-                                    text_align=ft.TextAlign.CENTER,
-                                ),],
-                                alignment=ft.MainAxisAlignment.START,
-                                spacing=10,
-                            ),
-                            ft.Divider(),
-                    ]))
-                    added_count += 1
+                    photo = read_photo_info(f.path)
                 except Exception as ex:
                     status.value = f"Error loading {f.name}: {str(ex)}"
                     page.update()
                     return
+                photos.append(photo)
+                known_paths.add(f.path)
+                scale_factors.append(1.0)
+                area_percentages.append(0.0)
+                selected.append(False)
+                photo_list.controls.append(ft.Container(height=row_extent(), data=len(photos) - 1))
+                added_count += 1
+            # The list scrolls to its end, so that is where rows are needed first
+            first_row = len(photos) - rows_per_view()
+            show_visible_rows()
+            # Build the rest of the thumbnails and the preview proxies in the background
+            if proxy_cache is not None and added_count:
+                page.run_thread(proxy_cache.warm, photos[-added_count:])
             status.value = (
-                f"{'Loaded' if not images else 'Added'} {added_count} new images successfully."
+                f"{'Loaded' if not photos else 'Added'} {added_count} new images successfully."
             )
             collage_preview.visible = False
+            layout_jobs.cancel()
             page.update()
 
     def handle_logo_upload(e: ft.FilePickerResultEvent):
@@ -349,53 +531,41 @@ def main(page: ft.Page):
 
     # Delete selected button
     def delete_selected(e):
-        to_delete = []
-        for i, ctrl in enumerate(photo_list.controls):
-            checkbox = ctrl.controls[0].controls[0]
-            if checkbox.value:
-                to_delete.append(i)
-        for i in sorted(to_delete, reverse=True):
-            del images[i]
-            del file_paths[i]
+        to_delete = [i for i, is_selected in enumerate(selected) if is_selected]
+        for i in reversed(to_delete):
+            del photos[i]
             del scale_factors[i]
             del area_percentages[i]
+            del selected[i]
+            live_slots.discard(photo_list.controls[i])
             del photo_list.controls[i]
+        for i, slot in enumerate(photo_list.controls):
+            slot.data = i
+        area_percentages[:] = [0.0] * len(photos)
+        refresh_live_rows()
+        # Rows below the deleted ones move up into view and need their controls
+        show_visible_rows()
         status.value = f"Deleted {len(to_delete)} images."
         collage_preview.visible = False
-        for i, ctrl in enumerate(photo_list.controls):
-            scale_pct = int((scale_factors[i] - 1.0) * 100)
-            scale_color = ft.Colors.GREEN if scale_factors[i] >= 1.0 else ft.Colors.RED
-            ctrl.controls[0].controls[4].value = f"Scale: {scale_pct}%"
-            ctrl.controls[0].controls[4].color = scale_color
-            ctrl.controls[0].controls[3].value = "Area: 0.00%"
+        layout_jobs.cancel()
         page.update()
 
     trash_button = ft.IconButton(icon=ft.Icons.DELETE, on_click=delete_selected)
 
     # Increase size button
     def increase_size(e):
-        selected_count = 0
-        for i, ctrl in enumerate(photo_list.controls):
-            checkbox = ctrl.controls[0].controls[0]
-            if not checkbox.value:
-                continue
-            selected_count += 1
-            scale_factors[i] *= 1.1
-            scale_pct = int((scale_factors[i] - 1.0) * 100)
-            scale_color = ft.Colors.GREEN if scale_factors[i] >= 1.0 else ft.Colors.RED
-            ctrl.controls[0].controls[4].value = f"Scale: {scale_pct}%"
-            ctrl.controls[0].controls[4].color = scale_color
-        if selected_count == 0:
+        changed = []
+        for i, is_selected in enumerate(selected):
+            if is_selected:
+                scale_factors[i] *= 1.1
+                changed.append(refresh_row(i))
+        if not changed:
             status.value = "No photos selected to increase size."
         else:
-            status.value = f"Increased size of {selected_count} selected photos by 10%."
+            status.value = f"Increased size of {len(changed)} selected photos by 10%."
         collage_preview.visible = False
-        for i, ctrl in enumerate(photo_list.controls):
-            scale_pct = int((scale_factors[i] - 1.0) * 100)
-            scale_color = ft.Colors.GREEN if scale_factors[i] >= 1.0 else ft.Colors.RED
-            ctrl.controls[0].controls[4].value = f"Scale: {scale_pct}%"
-            ctrl.controls[0].controls[4].color = scale_color
-        page.update()
+        layout_jobs.cancel()
+        push_rows(status, collage_preview, *changed)
 
     increase_button = ft.IconButton(
         icon=ft.Icons.ZOOM_IN, icon_color=ft.Colors.GREEN, on_click=increase_size
@@ -403,29 +573,18 @@ def main(page: ft.Page):
 
     # Decrease size button
     def decrease_size(e):
-        selected_count = 0
-        for i, ctrl in enumerate(photo_list.controls):
-            checkbox = ctrl.controls[0].controls[0]
-            if not checkbox.value:
-                continue
-            selected_count += 1
-            scale_factors[i] /= 1.1
-            scale_factors[i] = max(scale_factors[i], 0.1)
-            scale_pct = int((scale_factors[i] - 1.0) * 100)
-            scale_color = ft.Colors.GREEN if scale_factors[i] >= 1.0 else ft.Colors.RED
-            ctrl.controls[0].controls[4].value = f"Scale: {scale_pct}%"
-            ctrl.controls[0].controls[4].color = scale_color
-        if selected_count == 0:
+        changed = []
+        for i, is_selected in enumerate(selected):
+            if is_selected:
+                scale_factors[i] = max(scale_factors[i] / 1.1, 0.1)
+                changed.append(refresh_row(i))
+        if not changed:
             status.value = "No photos selected to decrease size."
         else:
-            status.value = f"Decreased size of {selected_count} selected photos by 10%."
+            status.value = f"Decreased size of {len(changed)} selected photos by 10%."
         collage_preview.visible = False
-        for i, ctrl in enumerate(photo_list.controls):
-            scale_pct = int((scale_factors[i] - 1.0) * 100)
-            scale_color = ft.Colors.GREEN if scale_factors[i] >= 1.0 else ft.Colors.RED
-            ctrl.controls[0].controls[4].value = f"Scale: {scale_pct}%"
-            ctrl.controls[0].controls[4].color = scale_color
-        page.update()
+        layout_jobs.cancel()
+        push_rows(status, collage_preview, *changed)
 
     decrease_button = ft.IconButton(
         icon=ft.Icons.ZOOM_OUT, icon_color=ft.Colors.RED, on_click=decrease_size
@@ -433,18 +592,14 @@ def main(page: ft.Page):
 
     # Select all button
     def select_all(e):
-        selected_count = 0
-        for ctrl in photo_list.controls:
-            checkbox = ctrl.controls[0].controls[0]
-            if not checkbox.value:
-                checkbox.value = True
-                selected_count += 1
+        selected_count = selected.count(False)
+        selected[:] = [True] * len(selected)
         status.value = (
             f"Selected {selected_count} images."
             if selected_count > 0
             else "All images already selected."
         )
-        page.update()
+        push_rows(status, *refresh_live_rows())
 
     select_all_button = ft.IconButton(
         icon=ft.Icons.CHECK_BOX, icon_color=ft.Colors.BLUE, on_click=select_all
@@ -452,18 +607,14 @@ def main(page: ft.Page):
 
     # Deselect all button
     def deselect_all(e):
-        deselected_count = 0
-        for ctrl in photo_list.controls:
-            checkbox = ctrl.controls[0].controls[0]
-            if checkbox.value:
-                checkbox.value = False
-                deselected_count += 1
+        deselected_count = selected.count(True)
+        selected[:] = [False] * len(selected)
         status.value = (
             f"Deselected {deselected_count} images."
             if deselected_count > 0
             else "No images were selected."
         )
-        page.update()
+        push_rows(status, *refresh_live_rows())
 
     deselect_all_button = ft.IconButton(
         icon=ft.Icons.CHECK_BOX_OUTLINE_BLANK, icon_color=ft.Colors.BLUE, on_click=deselect_all
@@ -471,17 +622,14 @@ def main(page: ft.Page):
 
     # Invert selection button
     def invert_selection(e):
-        toggled_count = 0
-        for ctrl in photo_list.controls:
-            checkbox = ctrl.controls[0].controls[0]
-            checkbox.value = not checkbox.value
-            toggled_count += 1
+        selected[:] = [not is_selected for is_selected in selected]
+        toggled_count = len(selected)
         status.value = (
             f"Inverted selection for {toggled_count} images."
             if toggled_count > 0
             else "No images to invert."
         )
-        page.update()
+        push_rows(status, *refresh_live_rows())
 
     invert_selection_button = ft.IconButton(
         icon=ft.Icons.SWAP_HORIZ, icon_color=ft.Colors.BLUE, on_click=invert_selection
@@ -489,389 +637,349 @@ def main(page: ft.Page):
 
     # Clear current selection button
     def clear_selection(e):
-        if images:
-            images.clear()
-            file_paths.clear()
+        if photos:
+            photos.clear()
             scale_factors.clear()
             area_percentages.clear()
+            selected.clear()
             photo_list.controls.clear()
+            live_slots.clear()
             status.value = "Cleared all images."
             collage_preview.visible = False
+            previous_layout[0] = None
+            layout_jobs.cancel()
             page.update()
         else:
             status.value = "No images to clear."
+            status.update()
 
     clear_selection_button = ft.IconButton(
         icon=ft.Icons.CLEAR_ALL, icon_color=ft.Colors.RED, on_click=clear_selection
     )
 
-    # Function to find minimal canvas for a given ratio (height / width)
-    def find_min_canvas(orig_sizes, num_images, ratio):
-        padding = (
-            int(padding_size.value) if padding_enabled.value and padding_size.value.isdigit() else 0
-        )
-        padding = max(0, padding)
-        min_side_req = max(
-            min(w * s, h * s) + 2 * padding for (w, h), s in zip(orig_sizes, scale_factors)
+    # Labels for the stages reported by the layout engine
+    stage_labels = {
+        "search": "Searching for the smallest canvas",
+        "optimize": "Optimizing the layout, seconds",
+        "preview": "Drawing preview",
+        "render": "Rendering print file",
+        "encode": "Encoding print file",
+        "sheets": "Rendering sheets",
+    }
+    last_progress_update = [0.0]
+
+    def on_job_progress(stage, done, total):
+        # Engine stages arrive per photo; keep the page refreshes down to ~10 per second
+        now = time.monotonic()
+        if now - last_progress_update[0] < 0.1:
+            return
+        last_progress_update[0] = now
+        counter = f" ({done}/{total})" if total else f" ({done})" if done else ""
+        status.value = f"{stage_labels.get(stage, stage)}...{counter}"
+        page.update()
+
+    def on_job_error(ex):
+        status.value = str(ex) if isinstance(ex, LayoutError) else f"Error: {str(ex)}"
+        page.update()
+
+    layout_jobs = LayoutJobRunner(on_progress=on_job_progress, on_error=on_job_error)
+    # Print files are compressed here while the next layout is already being worked on
+    collage_writer = BackgroundWriter()
+
+    # Multi-sheet variant of run_generate_job: pack onto fixed sheets, preview them side by
+    # side, then render every sheet to its own file in parallel
+    def run_sheets_job(job, settings, sizes, trace):
+        job_photos, branding = settings["photos"], settings["branding"]
+        paper, dpi = settings["paper"], settings["dpi"]
+        sheets = pack_sheets(
+            sizes,
+            settings["padding"],
+            *sheet_size(paper, dpi),
+            cache=packing_cache,
+            progress=job.progress,
+            strategies=settings["strategies"],
         )
-        max_side_req = max(
-            max(w * s, h * s) + 2 * padding for (w, h), s in zip(orig_sizes, scale_factors)
+        preview_base64 = image_to_base64(
+            render_sheets_preview(
+                sheets,
+                job_photos,
+                branding=branding,
+                progress=job.progress,
+                proxies=proxy_cache,
+            )
         )
-        low = max(min_side_req, math.ceil(max_side_req / ratio))
-        high = (
-            sum(max(w * s, h * s) + 2 * padding for (w, h), s in zip(orig_sizes, scale_factors)) * 2
+        sheet_note = (
+            f"{len(sheets)} {paper} sheet{'s' if len(sheets) > 1 else ''} at {dpi} DPI "
+            f"({sheets[0].canvas_width}x{sheets[0].canvas_height} pixels each)"
         )
 
-        min_width = float('inf')
-        min_height = float('inf')
-
-        while low < high:
-            mid = (low + high) // 2
-            cw = mid
-            ch = int(mid * ratio)
-            packer = newPacker(rotation=True)
-            for i, (w, h) in enumerate(orig_sizes):
-                scaled_w = max(1, int(w * scale_factors[i]))
-                scaled_h = max(1, int(h * scale_factors[i]))
-                packer.add_rect(scaled_w + 2 * padding, scaled_h + 2 * padding, rid=i)
-            packer.add_bin(cw, ch)
-            packer.pack()
-            if len(packer.rect_list()) == num_images:
-                high = mid
-                min_width = cw
-                min_height = ch
-            else:
-                low = mid + 1
-
-        return int(min_width), int(min_height)
-
-    # Function to find free spaces in the canvas
-    def find_free_spaces(canvas_width, canvas_height, rects, min_size=50):
-        free_rects = [(0, 0, canvas_width, canvas_height)]
-        new_free_rects = []
-        for _, x, y, w, h, _ in rects:
-            for fx, fy, fw, fh in free_rects:
-                if x + w <= fx or fx + fw <= x or y + h <= fy or fy + fh <= y:
-                    new_free_rects.append((fx, fy, fw, fh))
-                    continue
-                if fx < x:
-                    new_free_rects.append((fx, fy, x - fx, fh))
-                if fx + fw > x + w:
-                    new_free_rects.append((x + w, fy, fx + fw - (x + w), fh))
-                if fy < y:
-                    new_free_rects.append((fx, fy, fw, y - fy))
-                if fy + fh > y + h:
-                    new_free_rects.append((fx, y + h, fw, fy + fh - (y + h)))
-            free_rects = new_free_rects
-            new_free_rects = []
-        return [(x, y, w, h) for x, y, w, h in free_rects if w >= min_size and h >= min_size]
-
-    # Generate and save collage
-    def generate_layout(save_only=False):
-        if not images:
-            status.value = "No images loaded. Please upload photos first."
+        def show_preview():
+            percentages = [0.0] * len(job_photos)
+            for sheet in sheets:
+                for rid, value in enumerate(sheet.area_percentages):
+                    percentages[rid] += value
+            area_percentages[:] = percentages
+            refresh_live_rows()
+            collage_preview.src_base64 = preview_base64
+            collage_preview.visible = True
+            last_output_path[0] = None
+            status.value = f"Preview ready: {sheet_note}. Rendering the print files..."
             page.update()
-            return None, None, None
 
-        orig_sizes = [(img.width, img.height) for img in images]
-        num_images = len(images)
+        job.apply(show_preview)
+
+        output_dir = settings["output_dir"]
+        results = render_sheets(
+            sheets,
+            job_photos,
+            output_dir,
+            cmyk=settings["cmyk"],
+            branding=branding,
+            progress=job.progress,
+            profile=settings["output_format"],
+        )
+        seconds = sum(encoding.result() for *_, encoding in results)
+        base = os.path.splitext(results[0][0])[0].rpartition("_sheet")[0]
+        summary = finish_trace(trace, settings, base)
 
-        if num_images == 0:
-            status.value = "No images to pack."
+        def show_saved():
+            last_output_path[0] = results[0][0]
+            timing.value = summary
+            status.value = (
+                f"Layout saved on {sheet_note} as '{os.path.basename(results[0][0])}' "
+                f"to '{os.path.basename(results[-1][0])}' in '{output_dir}' "
+                f"(encoding took {seconds:.1f} s in total). "
+                f"Unused area on the last sheet: {sheets[-1].unused_pct:.2f}%. "
+                f"Packing: {sheets[0].strategy}. "
+                f"Double-tap the preview to open the first sheet in default viewer."
+            )
             page.update()
-            return None, None, None
 
-        padding = (
-            int(padding_size.value) if padding_enabled.value and padding_size.value.isdigit() else 0
+        job.apply(show_saved)
+
+    # Close a run's trace once its files are written: one-line summary for the timing text,
+    # and the JSON trace beside the output when asked for
+    def finish_trace(trace, settings, output_base):
+        trace.finish()
+        if settings["trace"]:
+            try:
+                trace.write(output_base + TRACE_SUFFIX)
+            except OSError:
+                pass
+        return f"Timing: {trace.summary()}"
+
+    # Every run records its stage timings into its own trace, including the encoding that
+    # finishes later on the writer thread
+    def run_traced_job(job, settings):
+        trace = RunTrace()
+        with trace.activate():
+            run_generate_job(job, settings, trace)
+
+    # Pack, preview and save the collage on the job runner; runs off the UI thread
+    def run_generate_job(job, settings, trace):
+        job_photos, branding = settings["photos"], settings["branding"]
+        sizes = scaled_sizes([photo.size for photo in job_photos], settings["scale_factors"])
+        grid = settings["layout_mode"] == "grid"
+        if settings["paper"] and not grid:
+            run_sheets_job(job, settings, sizes, trace)
+            return
+        keys = [photo.path for photo in job_photos]
+        search_options = {
+            "cache": packing_cache,
+            "strategies": settings["strategies"],
+            "time_budget": DEFAULT_PORTFOLIO_TIME_BUDGET,
+        }
+        if grid:
+            layout = grid_layout(
+                sizes,
+                settings["padding"],
+                *sheet_size(settings["paper"] or "A4", settings["dpi"]),
+                progress=job.progress,
+            )
+        elif settings["previous"] is not None:
+            previous, previous_keys, baseline_pct, _ = settings["previous"]
+            layout = update_layout(
+                previous,
+                previous_keys,
+                keys,
+                sizes,
+                settings["padding"],
+                settings["ratio"],
+                progress=job.progress,
+                baseline_pct=baseline_pct,
+                **search_options,
+            )
+        else:
+            layout = compute_layout(
+                sizes, settings["padding"], settings["ratio"], progress=job.progress, **search_options
+            )
+        incremental = layout.strategy.endswith(INCREMENTAL_SUFFIX)
+        if incremental:
+            baseline_pct = settings["previous"][2]
+        elif settings["optimize"] and not grid:
+            layout = optimize_layout(
+                layout,
+                settings["ratio"],
+                DEFAULT_OPTIMIZE_SECONDS,
+                cache=packing_cache,
+                progress=job.progress,
+            )
+        if not incremental:
+            baseline_pct = layout.unused_pct
+        canvas_width, canvas_height = layout.canvas_width, layout.canvas_height
+        if grid:
+            packing_note = f"Grid of {layout.strategy.split()[-1]} on {settings['paper'] or 'A4'}"
+        elif incremental:
+            packing_note = "Kept the previous arrangement"
+            if layout.pack_attempts:
+                packing_note += f", {layout.pack_attempts} photos placed into free space"
+        elif layout.cached:
+            packing_note = "Reused previous packing"
+        else:
+            packing_note = f"Pack attempts: {layout.pack_attempts}"
+        if not grid:
+            packing_note += f" ({layout.strategy})"
+        if len(layout.timeline) > 1:
+            seconds, unused = layout.timeline[-1]
+            packing_note += (
+                f". Optimizer cut unused area from {layout.timeline[0][1]:.2f}% "
+                f"to {unused:.2f}% in {seconds:.1f} s"
+            )
+
+        # Show a screen-resolution preview right away, then render the print file
+        panel, origin, _ = branding_overlay(layout, "RGB", **branding)
+        preview = render_preview(
+            layout,
+            job_photos,
+            extras=[(panel, origin)] if panel is not None else [],
+            progress=job.progress,
+            proxies=proxy_cache,
         )
-        padding = max(0, padding)
+        preview_base64 = image_to_base64(preview)
 
-        # Use current_ratio for canvas dimensions
-        portrait_w, portrait_h = find_min_canvas(orig_sizes, num_images, current_ratio)
-        portrait_area = portrait_w * portrait_h if portrait_w != float('inf') else float('inf')
-        landscape_w, landscape_h = find_min_canvas(orig_sizes, num_images, 1 / current_ratio)
-        landscape_area = landscape_w * landscape_h if landscape_w != float('inf') else float('inf')
+        def show_preview():
+            # A grid is not something the packer can edit in place
+            previous_layout[0] = (
+                None if grid else (layout, keys, baseline_pct, settings["strategies"])
+            )
+            area_percentages[:] = layout.area_percentages
+            refresh_live_rows()
+            collage_preview.src_base64 = preview_base64
+            collage_preview.visible = True
+            last_output_path[0] = None
+            status.value = (
+                f"Preview ready. Canvas size: {canvas_width}x{canvas_height} pixels. "
+                f"Unused area percentage: {layout.unused_pct:.2f}%. "
+                f"Rendering the full-resolution print file..."
+            )
+            page.update()
 
-        if portrait_area <= landscape_area:
-            canvas_width = portrait_w
-            canvas_height = portrait_h
-            orientation = "portrait"
-        else:
-            canvas_width = landscape_w
-            canvas_height = landscape_h
-            orientation = "landscape"
+        job.apply(show_preview)
+
+        output_dir = settings["output_dir"]
+        output_path, _, logo_status, encoding = render_to_file(
+            layout,
+            job_photos,
+            output_dir,
+            cmyk=settings["cmyk"],
+            branding=branding,
+            progress=job.progress,
+            profile=settings["output_format"],
+            writer=collage_writer,
+        )
+        if not settings["branding_enabled"]:
+            logo_status = "Logo and watermark text disabled."
 
-        if canvas_width == float('inf'):
-            status.value = "Could not fit all images."
+        def show_writing():
+            status.value = f"Writing '{os.path.basename(output_path)}'..."
             page.update()
-            return None, None, None
-
-        # Pack photos and check for sufficient free space
-        packer = newPacker(rotation=True)
-        for i, (w, h) in enumerate(orig_sizes):
-            scaled_w = max(1, int(w * scale_factors[i]))
-            scaled_h = max(1, int(h * scale_factors[i]))
-            packer.add_rect(scaled_w + 2 * padding, scaled_h + 2 * padding, rid=i)
-        packer.add_bin(canvas_width, canvas_height)
-        packer.pack()
-
-        if len(packer.rect_list()) != num_images:
-            # Increase canvas size incrementally until photos fit
-            scale_factor = 1.05
-            while len(packer.rect_list()) != num_images:
-                canvas_width = int(canvas_width * scale_factor)
-                canvas_height = int(canvas_height * scale_factor)
-                packer = newPacker(rotation=True)
-                for i, (w, h) in enumerate(orig_sizes):
-                    scaled_w = max(1, int(w * scale_factors[i]))
-                    scaled_h = max(1, int(h * scale_factors[i]))
-                    packer.add_rect(scaled_w + 2 * padding, scaled_h + 2 * padding, rid=i)
-                packer.add_bin(canvas_width, canvas_height)
-                packer.pack()
-                scale_factor += 0.05
-                if scale_factor > 2.0:
-                    status.value = "Could not fit all images even with larger canvas."
-                    page.update()
-                    return None, None, None
-
-        canvas_area = canvas_width * canvas_height
-        total_image_area = 0
-        area_percentages.clear()
-        all_rects = packer.rect_list()
-        for _, x, y, w, h, rid in all_rects:
-            orig_w, orig_h = orig_sizes[rid]
-            scaled_w = max(1, int(orig_w * scale_factors[rid]))
-            scaled_h = max(1, int(orig_h * scale_factors[rid]))
-            if w == scaled_h + 2 * padding and h == scaled_w + 2 * padding:
-                scaled_w, scaled_h = scaled_h, scaled_w
-            image_area = scaled_w * scaled_h
-            total_image_area += image_area
-            if canvas_area > 0:
-                area_pct = (image_area / canvas_area) * 100
+
+        def show_saved(seconds, summary):
+            last_output_path[0] = output_path
+            timing.value = summary
+            status.value = (
+                f"Layout generated and saved as '{os.path.basename(output_path)}' "
+                f"in '{output_dir}' (encoded in {seconds:.1f} s). "
+                f"Orientation: {layout.orientation}. "
+                f"Canvas size: {canvas_width}x{canvas_height} pixels. "
+                f"Unused area percentage: {layout.unused_pct:.2f}%. "
+                f"{packing_note}. "
+                f"{logo_status} Double-tap the preview to open in default viewer."
+            )
+            page.update()
+
+        def on_encoded(future):
+            # Runs on the writer thread once the file is on disk (or failed to be written)
+            if future.exception() is not None:
+                job.apply(on_job_error, future.exception())
             else:
-                area_pct = 0.0
-            area_percentages.append(area_pct)
+                summary = finish_trace(trace, settings, os.path.splitext(output_path)[0])
+                job.apply(show_saved, future.result(), summary)
 
-        if canvas_area > 0:
-            unused_pct = ((canvas_area - total_image_area) / canvas_area) * 100
-        else:
-            unused_pct = 0.0
+        if not encoding.done():
+            job.apply(show_writing)
+        encoding.add_done_callback(on_encoded)
 
-        mode = "CMYK" if cmyk_mode.value else "RGB"
-        canvas = Image.new(
-            mode,
-            (int(canvas_width), int(canvas_height)),
-            (255, 255, 255) if mode == "RGB" else (0, 0, 0, 0),
-        )
+    # Generate and save collage; a new click supersedes a run that is still in progress
+    def generate_layout(e=None):
+        if not photos:
+            status.value = "No images loaded. Please upload photos first."
+            page.update()
+            return
 
-        for _, x, y, w, h, rid in all_rects:
-            img = images[rid]
-            orig_w, orig_h = orig_sizes[rid]
-            scaled_w = max(1, int(orig_w * scale_factors[rid]))
-            scaled_h = max(1, int(orig_h * scale_factors[rid]))
-            if w == scaled_h + 2 * padding and h == scaled_w + 2 * padding:
-                img = img.rotate(90, expand=True)
-                scaled_w, scaled_h = scaled_h, scaled_w
-            img_resized = img.resize((scaled_w, scaled_h), Image.Resampling.LANCZOS)
-            padded_w = scaled_w + 2 * padding
-            padded_h = scaled_h + 2 * padding
-            padded_img = Image.new(
-                mode, (padded_w, padded_h), (255, 255, 255) if mode == "RGB" else (0, 0, 0, 0)
-            )
-            padded_img.paste(img_resized, (padding, padding))
-            canvas.paste(padded_img, (x, y))
+        padding = (
+            int(padding_size.value) if padding_enabled.value and padding_size.value.isdigit() else 0
+        )
+        padding = max(0, padding)
 
         # Add logo and/or watermark text in the largest free space if enabled
-        logo_status = ""
-        logo_added = False
-        text_added = False
         shop_text = watermark_text.value.strip() if watermark_enabled.value else ""
-        logo_available = logo_enabled.value and (
-            custom_logo_path[0] or os.path.exists(logo_path[0])
-        )
-        should_add_elements = logo_available or shop_text
-
-        if not should_add_elements:
-            logo_status = (
-                "No logo or watermark text selected."
-                if (logo_enabled.value or watermark_enabled.value)
-                else "Logo and watermark text disabled."
-            )
-        else:
-            try:
-                free_rects = find_free_spaces(canvas_width, canvas_height, all_rects, min_size=50)
-                if not free_rects:
-                    logo_status = "No free space available to add logo or watermark text."
-                else:
-                    # Select the largest free rectangle by area
-                    largest_rect = max(free_rects, key=lambda r: r[2] * r[3], default=None)
-                    if largest_rect:
-                        fx, fy, fw, fh = largest_rect
-                        draw = ImageDraw.Draw(canvas)
-                        logo_w, logo_h, scaled_logo_w, scaled_logo_h = 0, 0, 0, 0
-                        text_w, text_h = 0, 0
-                        logo_x, logo_y = fx, fy
-
-                        # Calculate text size if watermark text is enabled and non-empty
-                        text_fits = shop_text
-                        font_size = (
-                            int(font_size_dropdown.value) if font_size_dropdown.value else 24
-                        )
-                        if shop_text:
-                            try:
-                                font = ImageFont.truetype(typeface_dropdown.value, size=font_size)
-                            except:
-                                font = ImageFont.load_default()
-                            text_bbox = draw.textbbox((0, 0), shop_text, font=font)
-                            text_w = text_bbox[2] - text_bbox[0]
-                            text_h = text_bbox[3] - text_bbox[1]
-                            # Adjust font size down if text doesn't fit
-                            while text_w > fw or text_h > fh and font_size >= 12:
-                                font_size -= 2
-                                try:
-                                    font = ImageFont.truetype(
-                                        typeface_dropdown.value, size=font_size
-                                    )
-                                except:
-                                    font = ImageFont.load_default()
-                                text_bbox = draw.textbbox((0, 0), shop_text, font=font)
-                                text_w = text_bbox[2] - text_bbox[0]
-                                text_h = text_bbox[3] - text_bbox[1]
-                            text_fits = text_w <= fw and text_h <= fh
-
-                        # Calculate logo size if enabled and available
-                        if logo_available:
-                            current_logo_path = (
-                                custom_logo_path[0] if custom_logo_path[0] else logo_path[0]
-                            )
-                            logo_img = Image.open(current_logo_path)
-                            if cmyk_mode.value:
-                                logo_img = logo_img.convert("CMYK")
-                            logo_w, logo_h = logo_img.size
-                            logo_scale = 0.98
-                            if shop_text and text_fits:
-                                scale = (
-                                    min(fw / logo_w, (fh - text_h - 10) / logo_h, 1.0) * logo_scale
-                                )
-                            else:
-                                scale = min(fw / logo_w, fh / logo_h, 1.0) * logo_scale
-                            scaled_logo_w = int(logo_w * scale)
-                            scaled_logo_h = int(logo_h * scale)
-
-                        # Check if logo and text fit side by side
-                        total_width = (
-                            scaled_logo_w + 10 + text_w
-                            if shop_text and logo_available and text_fits
-                            else (
-                                text_w
-                                if shop_text and text_fits
-                                else scaled_logo_w if logo_available else 0
-                        ))
-                        if (
-                            total_width > fw
-                            or max(scaled_logo_h, text_h if shop_text and text_fits else 0) > fh
-                        ):
-                            # Try fitting only logo or only text if both don't fit
-                            if logo_available and shop_text and text_fits:
-                                if scaled_logo_w <= fw and scaled_logo_h <= fh:
-                                    total_width = scaled_logo_w
-                                    text_fits = False
-                                elif text_w <= fw and text_h <= fh:
-                                    total_width = text_w
-                                    scaled_logo_w = scaled_logo_h = 0
-                                else:
-                                    total_width = 0
-                                    text_fits = False
-                                    scaled_logo_w = scaled_logo_h = 0
-                            elif shop_text and text_fits and text_w > fw:
-                                text_fits = False
-                                total_width = scaled_logo_w if logo_available else 0
-                            elif logo_available and scaled_logo_w > fw:
-                                scaled_logo_w = scaled_logo_h = 0
-                                total_width = text_w if shop_text and text_fits else 0
-
-                        # Paste logo if enabled and fits
-                        if logo_available and scaled_logo_w > 0 and scaled_logo_h > 0:
-                            logo_resized = logo_img.resize(
-                                (scaled_logo_w, scaled_logo_h), Image.Resampling.LANCZOS
-                            )
-                            logo_x = fx + (fw - total_width) // 2
-                            logo_y = fy + (fh - scaled_logo_h) // 2
-                            canvas.paste(logo_resized, (logo_x, logo_y))
-                            logo_added = True
-
-                        # Paste text if enabled, not empty, and fits
-                        if shop_text and text_fits:
-                            text_x = (
-                                (logo_x + scaled_logo_w + 10)
-                                if logo_added
-                                else fx + (fw - text_w) // 2
-                            )
-                            text_y = fy + (fh - text_h) // 2
-                            text_color = (0, 0, 0) if mode == "RGB" else (0, 0, 0, 255)
-                            draw.text((text_x, text_y), shop_text, font=font, fill=text_color)
-                            text_added = True
-
-                        if logo_added and text_added:
-                            logo_status = "Logo and watermark text maximized in largest free space."
-                        elif logo_added:
-                            logo_status = (
-                                "Logo maximized in largest free space, but watermark text does not fit."
-                                if shop_text
-                                else "Logo maximized in largest free space."
-                            )
-                        elif text_added:
-                            logo_status = "Watermark text maximized in largest free space."
-                        else:
-                            logo_status = "Free space too small to add logo or watermark text."
-                    else:
-                        logo_status = "No suitable free space to add logo or watermark text."
-            except Exception as ex:
-                logo_status = f"Error loading or adding logo/watermark: {str(ex)}"
-
-        for i, ctrl in enumerate(photo_list.controls):
-            scale_pct = int((scale_factors[i] - 1.0) * 100)
-            scale_color = ft.Colors.GREEN if scale_factors[i] >= 1.0 else ft.Colors.RED
-            area_pct = area_percentages[i]
-            ctrl.controls[0].controls[3].value = f"Area: {area_pct:.2f}%"
-            ctrl.controls[0].controls[4].value = f"Scale: {scale_pct}%"
-            ctrl.controls[0].controls[4].color = scale_color
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_ext = "tiff" if cmyk_mode.value else "png"
-        output_filename = f"a_series_photo_layout_{timestamp}.{file_ext}"
-        output_path = os.path.join(save_directory[0], output_filename)
-        preview_filename = (
-            f"a_series_photo_layout_preview_{timestamp}.png" if cmyk_mode.value else output_filename
+        current_logo_path = custom_logo_path[0] or logo_path[0]
+        logo_available = logo_enabled.value and os.path.exists(current_logo_path)
+        branding = {
+            "logo_path": current_logo_path if logo_available else None,
+            "text": shop_text,
+            "font_name": typeface_dropdown.value,
+            "font_size": int(font_size_dropdown.value) if font_size_dropdown.value else 24,
+        }
+
+        # The last layout is only edited in place while it was searched with the same
+        # strategies; otherwise e.g. ticking the portfolio would not change anything
+        strategies = PACK_PORTFOLIO if portfolio_mode.value else None
+        previous = previous_layout[0] if incremental_mode.value else None
+        if previous is not None and previous[3] != strategies:
+            previous = None
+
+        # Widgets are read here on the UI thread; the job only sees this snapshot
+        settings = {
+            "photos": list(photos),
+            "scale_factors": list(scale_factors),
+            "padding": padding,
+            "ratio": current_ratio,
+            "strategies": strategies,
+            "previous": previous,
+            "optimize": optimize_mode.value,
+            "cmyk": cmyk_mode.value,
+            "trace": trace_enabled.value,
+            "output_format": None
+            if output_format_dropdown.value == "auto"
+            else output_format_dropdown.value,
+            "paper": None if sheet_paper_dropdown.value == "canvas" else sheet_paper_dropdown.value,
+            "layout_mode": layout_mode_dropdown.value,
+            "dpi": int(sheet_dpi.value) if sheet_dpi.value.isdigit() else DEFAULT_DPI,
+            "branding": branding,
+            "branding_enabled": logo_enabled.value or watermark_enabled.value,
+            "output_dir": save_directory[0],
+        }
+        superseded = layout_jobs.busy
+        layout_jobs.submit(lambda job: run_traced_job(job, settings))
+        timing.value = ""
+        status.value = (
+            "Previous run cancelled. Arranging photos..." if superseded else "Arranging photos..."
         )
-        preview_path = os.path.join(save_directory[0], preview_filename)
-
-        try:
-            canvas.save(output_path)
-            if cmyk_mode.value:
-                rgb_canvas = canvas.convert("RGB")
-                rgb_canvas.save(preview_path)
-            if not save_only:
-                collage_preview.src = preview_path
-                collage_preview.visible = True
-                last_output_path[0] = output_path
-                status.value = (
-                    f"Layout generated and saved as '{output_filename}' in '{save_directory[0]}'. "
-                    f"Orientation: {orientation}. "
-                    f"Canvas size: {canvas_width}x{canvas_height} pixels. "
-                    f"Unused area percentage: {unused_pct:.2f}%. "
-                    f"{logo_status} Double-tap the preview to open in default viewer."
-                )
-                page.update()
-            return output_path, canvas_width, canvas_height
-        except Exception as ex:
-            status.value = f"Error saving file: {str(ex)}"
-            page.update()
-            return None, None, None
+        page.update()
 
-    generate_button = ft.ElevatedButton(
-        "Arrange Photos into Canvas", on_click=lambda e: generate_layout()
-    )
+    generate_button = ft.ElevatedButton("Arrange Photos into Canvas", on_click=generate_layout)
 
     page.add(
         ft.Column([
@@ -906,6 +1014,11 @@ def main(page: ft.Page):
                         ft.Divider(),
                         ft.Text("Settings:", size=16),
                         cmyk_mode,
+                        portfolio_mode,
+                        optimize_mode,
+                        incremental_mode,
+                        trace_enabled,
+                        output_format_dropdown,
                         ft.Row([
                             padding_enabled,
                             padding_size,
@@ -913,6 +1026,14 @@ def main(page: ft.Page):
                             alignment=ft.MainAxisAlignment.START,
                             spacing=10,
                         ),
+                        ft.Row([
+                            layout_mode_dropdown,
+                            sheet_paper_dropdown,
+                            sheet_dpi,
+                            ],
+                            alignment=ft.MainAxisAlignment.START,
+                            spacing=10,
+                        ),
                         ft.Row([
                             paper_ratio_dropdown,
                             custom_ratio,
@@ -956,6 +1077,7 @@ def main(page: ft.Page):
                         ft.Text("Collage Preview (Double-tap to open):", size=14),
                         collage_preview_gesture,
                         status,
+                        timing,
                     ],
                     alignment=ft.MainAxisAlignment.START,
                     horizontal_alignment=ft.CrossAxisAlignment.CENTER,
@@ -970,22 +1092,24 @@ def main(page: ft.Page):
     def on_resize(e):
         nonlocal photo_size
         photo_size = get_list_params()
-        for ctrl in photo_list.controls:
-            ctrl.controls[0].controls[1].width = photo_size
-            ctrl.controls[0].controls[1].height = photo_size
-            idx = photo_list.controls.index(ctrl)
-            scale_pct = int((scale_factors[idx] - 1.0) * 100)
-            scale_color = ft.Colors.GREEN if scale_factors[idx] >= 1.0 else ft.Colors.RED
-            ctrl.controls[0].controls[4].value = f"Scale: {scale_pct}%"
-            ctrl.controls[0].controls[4].color = scale_color
-            ctrl.controls[0].controls[3].value = f"Area: {area_percentages[idx]:.2f}%"
+        photo_list.item_extent = row_extent()
+        for slot in photo_list.controls:
+            slot.height = row_extent()
+        for slot in live_slots:
+            thumbnail = slot.content.controls[0].controls[1]
+            thumbnail.width = photo_size
+            thumbnail.height = photo_size
+        # A taller window shows more rows
+        show_visible_rows()
         collage_preview.width = page.width * 0.4 / current_ratio
         collage_preview.height = page.height * 0.4
         # Ensure preview remains visible if it was already generated
-        if last_output_path[0] and collage_preview.src:
+        if collage_preview.src_base64:
             collage_preview.visible = True
         page.update()
 
     page.on_resize = on_resize
 
-ft.app(target=main, assets_dir="assets")
\ No newline at end of file
+# The guard keeps process-pool workers that re-import this module from opening windows
+if __name__ == "__main__":
+    ft.app(target=main, assets_dir="assets")
\ No newline at end of file
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+from PIL import Image, ImageDraw
+
+# The app's code lives in src/ (the Flet app path), not in an installed package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from collage import read_photo_info  # noqa: E402
+
+PHOTO_SIZES = [(120, 80), (60, 90), (100, 100), (80, 50), (45, 130), (150, 70)]
+
+
+# A photo with a gradient and a diagonal, so any resampling or placement difference shows
+def make_photo(path, size, seed=0):
+    w, h = size
+    img = Image.linear_gradient("L").resize((w, h)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    draw.line((0, 0, w, h), fill=(255, 40 * seed % 256, 0), width=3)
+    draw.rectangle((0, 0, w // 3, h // 4), fill=(0, 90, 200 - 20 * seed % 200))
+    img.save(path)
+    return path
+
+
+@pytest.fixture
+def photo_paths(tmp_path):
+    return [
+        make_photo(str(tmp_path / f"photo{i}.png"), size, i) for i, size in enumerate(PHOTO_SIZES)
+    ]
+
+
+@pytest.fixture
+def photos(photo_paths):
+    return [read_photo_info(path) for path in photo_paths]
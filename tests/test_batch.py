@@ -0,0 +1,72 @@
+import json
+import os
+
+from collage import TRACE_SUFFIX
+from collage.__main__ import main
+from collage.batch import LAYOUT_SUFFIX, find_job_files
+
+
+def write_job(jobs_dir, name, **settings):
+    path = os.path.join(jobs_dir, f"{name}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    return path
+
+
+def read_result(jobs_dir, name):
+    with open(os.path.join(jobs_dir, f"{name}{LAYOUT_SUFFIX}"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_layout_and_trace_files_are_not_jobs(tmp_path):
+    job = write_job(str(tmp_path), "job", photos=[])
+    for suffix in (LAYOUT_SUFFIX, TRACE_SUFFIX):
+        (tmp_path / f"job{suffix}").write_text("{}")
+    assert find_job_files(str(tmp_path)) == [job]
+
+
+def test_batch_renders_every_job(tmp_path, photo_paths):
+    jobs_dir = tmp_path / "jobs"
+    jobs_dir.mkdir()
+    write_job(str(jobs_dir), "first", photos=photo_paths, padding=2)
+    write_job(str(jobs_dir), "second", photos=photo_paths[:3])
+    assert main([str(jobs_dir), "-j", "2"]) == 0
+    for name, count in (("first", 6), ("second", 3)):
+        result = read_result(str(jobs_dir), name)
+        assert os.path.exists(result["output"])
+        assert len(result["layout"]["placements"]) == count
+
+
+def test_failed_job_sets_the_exit_status(tmp_path):
+    write_job(str(tmp_path), "broken", photos=[str(tmp_path / "missing.jpg")])
+    assert main([str(tmp_path), "-j", "1"]) == 1
+
+
+def test_sheet_jobs_run_twice_with_a_disk_cache(tmp_path, photo_paths):
+    jobs_dir = tmp_path / "jobs"
+    jobs_dir.mkdir()
+    write_job(str(jobs_dir), "sheets", photos=photo_paths, paper="A5", dpi=40)
+    cache_dir = str(tmp_path / "cache")
+    assert main([str(jobs_dir), "-j", "1", "--cache-dir", cache_dir]) == 0
+    assert main([str(jobs_dir), "-j", "1", "--cache-dir", cache_dir]) == 0
+    result = read_result(str(jobs_dir), "sheets")
+    assert all(sheet["cached"] for sheet in result["sheets"])
+    assert all(os.path.exists(path) for path in result["outputs"])
+
+
+# Regression: a traced job's .trace.json beside its job file failed the next batch run
+def test_batch_runs_again_after_writing_traces(tmp_path, photo_paths):
+    write_job(str(tmp_path), "traced", photos=photo_paths, trace=True, padding=2)
+    assert main([str(tmp_path), "-j", "1"]) == 0
+    assert (tmp_path / f"traced{TRACE_SUFFIX}").exists()
+    assert main([str(tmp_path), "-j", "1"]) == 0
+    assert read_result(str(tmp_path), "traced")["stages"]["search"]["photos"] == 6
+
+
+def test_grid_jobs_report_no_pack_attempts(tmp_path, photo_paths):
+    write_job(str(tmp_path), "grid", photos=photo_paths, layout_mode="grid", paper="A5", dpi=50)
+    assert main([str(tmp_path), "-j", "1"]) == 0
+    result = read_result(str(tmp_path), "grid")
+    assert result["layout"]["strategy"].startswith("grid ")
+    assert result["layout"]["pack_attempts"] == 0
+    assert "pack_attempts" not in result["stages"]["search"]
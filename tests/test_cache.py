@@ -0,0 +1,50 @@
+from collage import PackingCache, compute_layout, pack_sheets
+
+SIZES = [(300, 200), (200, 300), (250, 250), (400, 120), (120, 90)] * 3
+
+
+def test_canvas_packing_is_reused_from_disk(tmp_path):
+    cache = PackingCache(directory=str(tmp_path))
+    first = compute_layout(SIZES, 4, 2**0.5, parallel=False, cache=cache)
+    cache = PackingCache(directory=str(tmp_path))
+    again = compute_layout(SIZES, 4, 2**0.5, parallel=False, cache=cache)
+    assert again.cached and cache.hits == 1
+    assert again.rects == first.rects
+    assert (again.canvas_width, again.canvas_height) == (first.canvas_width, first.canvas_height)
+
+
+# Regression: cached sheet packings could not be read back (KeyError: 'rects')
+def test_sheet_packing_is_reused_from_disk(tmp_path):
+    first = pack_sheets(SIZES, 4, 600, 800, cache=PackingCache(directory=str(tmp_path)))
+    assert len(first) > 1
+    cache = PackingCache(directory=str(tmp_path))
+    again = pack_sheets(SIZES, 4, 600, 800, cache=cache)
+    assert cache.hits == 1 and all(sheet.cached for sheet in again)
+    assert [sheet.rects for sheet in again] == [sheet.rects for sheet in first]
+    assert [sheet.strategy for sheet in again] == [sheet.strategy for sheet in first]
+
+
+def test_entry_without_rects_is_a_miss(tmp_path):
+    PackingCache(directory=str(tmp_path)).put(("old",), {"sheets": [[[0, 0, 0, 5, 5, 0]]]})
+    cache = PackingCache(directory=str(tmp_path))
+    assert cache.get(("old",)) is None
+    assert cache.misses == 1
+
+
+def test_sheets_hold_every_photo_once():
+    sheets = pack_sheets(SIZES + [(5000, 100)], 4, 600, 800)
+    placed = sorted(rid for sheet in sheets for *_, rid in sheet.rects)
+    assert placed == list(range(len(SIZES) + 1))
+    for sheet in sheets:
+        assert (sheet.canvas_width, sheet.canvas_height) == (600, 800)
+        for _, x, y, w, h, _ in sheet.rects:
+            assert x + w <= 600 and y + h <= 800
+
+
+def test_memory_cache_keeps_the_newest_entries():
+    cache = PackingCache(max_entries=2)
+    for key in "abc":
+        cache.put(key, {"rects": []})
+    assert cache.get("a") is None
+    assert cache.get("c") == {"rects": []}
+    assert len(cache) == 2
@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+import pytest
+
+from collage import find_free_spaces, largest_free_rect
+
+
+def random_canvas(rng):
+    width, height = rng.randint(8, 40), rng.randint(8, 30)
+    rects = []
+    for rid in range(rng.randint(0, 8)):
+        w, h = rng.randint(1, width // 2), rng.randint(1, height // 2)
+        x, y = rng.randint(0, width - w), rng.randint(0, height - h)
+        rects.append((0, x, y, w, h, rid))
+    return width, height, rects
+
+
+def occupancy(width, height, rects):
+    grid = np.zeros((height, width), dtype=bool)
+    for _, x, y, w, h, _ in rects:
+        grid[y : y + h, x : x + w] = True
+    return grid
+
+
+# Largest empty area by brute force: for every band of rows, the longest run of columns
+# that are free on all of them
+def brute_force_largest_area(grid):
+    height, width = grid.shape
+    best = 0
+    for top in range(height):
+        blocked = np.zeros(width, dtype=bool)
+        for bottom in range(top, height):
+            blocked |= grid[bottom]
+            run = longest = 0
+            for cell in blocked:
+                run = 0 if cell else run + 1
+                longest = max(longest, run)
+            best = max(best, longest * (bottom - top + 1))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_largest_free_rect_matches_brute_force(seed):
+    width, height, rects = random_canvas(random.Random(seed))
+    grid = occupancy(width, height, rects)
+    expected = brute_force_largest_area(grid)
+    found = largest_free_rect(width, height, rects, min_size=1)
+    if expected == 0:
+        assert found is None
+        return
+    x, y, w, h = found
+    assert w * h == expected
+    assert not grid[y : y + h, x : x + w].any()
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_free_spaces_are_empty_and_maximal(seed):
+    width, height, rects = random_canvas(random.Random(seed))
+    grid = occupancy(width, height, rects)
+    spaces = find_free_spaces(width, height, rects, min_size=1)
+    assert len(spaces) == len(set(spaces))
+    areas = [w * h for _, _, w, h in spaces]
+    assert areas == sorted(areas, reverse=True)
+    for x, y, w, h in spaces:
+        assert not grid[y : y + h, x : x + w].any()
+        # Growing any side by one pixel leaves the canvas or hits a photo
+        assert x == 0 or grid[y : y + h, x - 1].any()
+        assert y == 0 or grid[y - 1, x : x + w].any()
+        assert x + w == width or grid[y : y + h, x + w].any()
+        assert y + h == height or grid[y + h, x : x + w].any()
+
+
+def test_min_size_filters_small_spaces():
+    rects = [(0, 0, 0, 100, 90, 0)]
+    assert find_free_spaces(100, 100, rects, min_size=20) == []
+    assert find_free_spaces(100, 100, rects, min_size=10) == [(0, 90, 100, 10)]
+    assert largest_free_rect(100, 100, [], min_size=50) == (0, 0, 100, 100)
@@ -0,0 +1,69 @@
+import math
+import random
+
+import pytest
+
+from collage import LayoutError, best_grid_columns, grid_layout
+from collage import grid
+
+
+# The column count search of the original grid app: every column count, photo by photo
+def scalar_best_columns(sizes, width, height, padding=0):
+    best_cols, best_used = 1, -1.0
+    for cols in range(1, len(sizes) + 1):
+        rows = math.ceil(len(sizes) / cols)
+        cell_w, cell_h = width / cols - 2 * padding, height / rows - 2 * padding
+        used = 0.0
+        for w, h in sizes:
+            scale = max(min(cell_w / w, cell_h / h), min(cell_w / h, cell_h / w), 0.0)
+            used += w * h * scale * scale
+        if used > best_used:
+            best_cols, best_used = cols, used
+    return best_cols, best_used
+
+
+def random_sizes(count, seed):
+    rng = random.Random(seed)
+    return [(rng.randint(50, 500), rng.randint(50, 500)) for _ in range(count)]
+
+
+@pytest.mark.parametrize("count", [1, 2, 7, 50, 300])
+@pytest.mark.parametrize("padding", [0, 6])
+def test_vectorized_search_matches_scalar_loop(count, padding):
+    sizes = random_sizes(count, count + padding)
+    cols, used = best_grid_columns(sizes, 2480, 3508, padding)
+    expected_cols, expected_used = scalar_best_columns(sizes, 2480, 3508, padding)
+    assert cols == expected_cols
+    assert used == pytest.approx(expected_used, rel=1e-12)
+
+
+def test_chunked_search_matches_one_pass(monkeypatch):
+    sizes = random_sizes(333, 1)
+    expected = best_grid_columns(sizes, 2480, 3508, 3)
+    monkeypatch.setattr(grid, "GRID_CHUNK_ELEMENTS", 1000)
+    assert best_grid_columns(sizes, 2480, 3508, 3) == expected
+
+
+@pytest.mark.parametrize("count", [1, 5, 60])
+def test_grid_layout_places_every_photo_inside_its_cell(count):
+    sizes = random_sizes(count, 7)
+    layout = grid_layout(sizes, 4, 2480, 3508)
+    assert layout.pack_attempts == 0
+    assert layout.strategy.startswith(grid.GRID_STRATEGY)
+    assert sorted(rect[5] for rect in layout.rects) == list(range(count))
+    boxes = [(x, y, x + w, y + h) for _, x, y, w, h, _ in layout.rects]
+    for x0, y0, x1, y1 in boxes:
+        assert 0 <= x0 < x1 <= 2480 and 0 <= y0 < y1 <= 3508
+    for i, a in enumerate(boxes):
+        for b in boxes[i + 1 :]:
+            assert a[2] <= b[0] or b[2] <= a[0] or a[3] <= b[1] or b[3] <= a[1]
+    # Photos keep their aspect ratio, up to rounding both sides down to whole pixels
+    for (w, h), (fit_w, fit_h) in zip(sizes, layout.sizes):
+        assert abs(fit_w * h - fit_h * w) < max(w, h)
+
+
+def test_grid_layout_errors():
+    with pytest.raises(LayoutError):
+        grid_layout([], 0, 100, 100)
+    with pytest.raises(LayoutError):
+        grid_layout([(10, 10)] * 4, 40, 100, 100)
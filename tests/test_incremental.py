@@ -0,0 +1,52 @@
+from collage import INCREMENTAL_SUFFIX, compute_layout, match_photos, update_layout
+
+RATIO = 2**0.5
+SIZES = [(300, 200), (200, 300), (250, 250), (400, 120), (120, 90), (220, 160)]
+
+
+def assert_no_overlap(layout):
+    boxes = [(x, y, x + w, y + h) for _, x, y, w, h, _ in layout.rects]
+    for x0, y0, x1, y1 in boxes:
+        assert 0 <= x0 and 0 <= y0 and x1 <= layout.canvas_width and y1 <= layout.canvas_height
+    for i, a in enumerate(boxes):
+        for b in boxes[i + 1 :]:
+            assert a[2] <= b[0] or b[2] <= a[0] or a[3] <= b[1] or b[3] <= a[1]
+
+
+def test_match_photos_pairs_repeated_keys_in_order():
+    assert match_photos(["a", "b", "a"], ["a", "a", "c", "b", "a"]) == [0, 2, None, 1, None]
+
+
+def test_unchanged_photos_keep_the_layout():
+    keys = [str(i) for i in range(len(SIZES))]
+    previous = compute_layout(SIZES, 2, RATIO, parallel=False)
+    assert update_layout(previous, keys, keys, SIZES, 2, RATIO, parallel=False) is previous
+
+
+def test_removed_photo_leaves_the_others_in_place():
+    keys = [str(i) for i in range(len(SIZES))]
+    previous = compute_layout(SIZES, 2, RATIO, parallel=False)
+    layout = update_layout(
+        previous, keys, keys[1:], SIZES[1:], 2, RATIO, baseline_pct=100.0, parallel=False
+    )
+    assert layout.strategy.endswith(INCREMENTAL_SUFFIX)
+    before = {rect[5]: rect[1:5] for rect in previous.rects}
+    assert [rect[1:5] for rect in layout.rects] == [before[rid + 1] for rid in range(len(keys) - 1)]
+    assert_no_overlap(layout)
+
+
+def test_new_photo_goes_into_free_space_or_triggers_a_search():
+    keys = [str(i) for i in range(len(SIZES))]
+    previous = compute_layout(SIZES, 2, RATIO, parallel=False)
+    sizes = SIZES + [(40, 30)]
+    layout = update_layout(previous, keys, keys + ["new"], sizes, 2, RATIO, parallel=False)
+    assert sorted(rect[5] for rect in layout.rects) == list(range(len(sizes)))
+    assert_no_overlap(layout)
+
+
+def test_padding_change_searches_again():
+    keys = [str(i) for i in range(len(SIZES))]
+    previous = compute_layout(SIZES, 2, RATIO, parallel=False)
+    layout = update_layout(previous, keys, keys, SIZES, 5, RATIO, parallel=False)
+    assert layout.padding == 5 and not layout.strategy.endswith(INCREMENTAL_SUFFIX)
+    assert_no_overlap(layout)
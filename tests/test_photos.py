@@ -0,0 +1,36 @@
+import pytest
+from PIL import Image
+
+from collage import load_photo, read_photo_info
+from collage.engine import _prepare_photo
+from collage.photos import EXIF_ORIENTATION
+
+
+# Modes Image.reduce() rejects must still render when shrunk 2x or more
+@pytest.mark.parametrize("mode", ["1", "P", "I;16", "L", "RGB", "RGBA"])
+def test_shrunk_photos_render_in_any_mode(tmp_path, mode):
+    path = str(tmp_path / "photo.png")
+    Image.new(mode, (400, 300)).save(path)
+    photo = read_photo_info(path)
+    prepared = _prepare_photo(photo, 100, 75, False, "RGB")
+    assert prepared.size == (100, 75) and prepared.mode == "RGB"
+
+
+def test_load_photo_reduces_but_still_covers_the_target(tmp_path):
+    path = str(tmp_path / "big.png")
+    Image.new("RGB", (800, 600), (10, 20, 30)).save(path)
+    with load_photo(read_photo_info(path), (190, 140)) as img:
+        assert img.size == (200, 150)
+
+
+def test_exif_orientation_is_applied(tmp_path):
+    path = str(tmp_path / "turned.jpg")
+    img = Image.new("RGB", (60, 40), (200, 0, 0))
+    exif = img.getexif()
+    exif[EXIF_ORIENTATION] = 6
+    img.save(path, exif=exif)
+    photo = read_photo_info(path)
+    assert (photo.width, photo.height) == (60, 40)
+    assert photo.size == (40, 60)
+    with load_photo(photo) as upright:
+        assert upright.size == (40, 60)
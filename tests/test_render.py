@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageChops
+
+from collage import (
+    CmykConverter,
+    branding_layers,
+    compute_layout,
+    load_photo,
+    render_banded,
+    render_collage,
+    render_to_file,
+)
+from collage import engine
+from collage.engine import blank_canvas
+
+
+def assert_same_pixels(a, b):
+    assert a.mode == b.mode and a.size == b.size
+    assert ImageChops.difference(a, b).getbbox() is None
+
+
+@pytest.fixture
+def layout(photos):
+    return compute_layout([photo.size for photo in photos], 3, 2**0.5, parallel=False)
+
+
+# The render path before user-008: resize, rotate with rotate(90, expand=True), paste the
+# photo into a white padded copy and paste that onto the canvas
+def reference_render(layout, photos):
+    canvas = blank_canvas("RGB", (layout.canvas_width, layout.canvas_height))
+    pad = layout.padding
+    for rid, x, y, w, h, rotated in layout.placements():
+        upright = (h, w) if rotated else (w, h)
+        with load_photo(photos[rid], upright) as img:
+            img = img.convert("RGB").resize(upright, Image.Resampling.LANCZOS)
+        if rotated:
+            img = img.rotate(90, expand=True)
+        padded = Image.new("RGB", (img.width + 2 * pad, img.height + 2 * pad), (255, 255, 255))
+        padded.paste(img, (pad, pad))
+        canvas.paste(padded, (x, y))
+    return canvas
+
+
+def test_render_collage_matches_padded_copy_render(layout, photos):
+    # The fixture photos pack with some of them turned, so both paths are compared
+    assert any(rotated for *_, rotated in layout.placements())
+    assert_same_pixels(render_collage(layout, photos, workers=2), reference_render(layout, photos))
+
+
+@pytest.mark.parametrize("band_height", [1, 16, 64, 10_000])
+def test_banded_tiff_matches_in_memory_render(layout, photos, tmp_path, band_height):
+    path = str(tmp_path / "banded.tif")
+    render_banded(layout, photos, path, band_height=band_height, workers=2)
+    with Image.open(path) as tiff:
+        assert_same_pixels(tiff.convert("RGB"), render_collage(layout, photos))
+
+
+def test_banded_cmyk_matches_converted_render(layout, photos, tmp_path):
+    path = str(tmp_path / "banded.tif")
+    render_banded(layout, photos, path, cmyk=True, band_height=32)
+    expected = CmykConverter()(render_collage(layout, photos))
+    with Image.open(path) as tiff:
+        tiff.load()
+        assert_same_pixels(tiff, expected)
+
+
+@pytest.mark.parametrize("profile", ["tiff", "tiff-deflate"])
+def test_banded_render_to_file_matches_in_memory(layout, photos, tmp_path, profile):
+    branding = {"text": "Test shop"}
+    in_memory, _, _, encoding = render_to_file(
+        layout, photos, str(tmp_path), "memory", branding=branding, profile="tiff", banded=False
+    )
+    encoding.result()
+    banded, preview, _, encoding = render_to_file(
+        layout, photos, str(tmp_path), "bands", branding=branding, profile=profile, banded=True
+    )
+    encoding.result()
+    assert in_memory.endswith(".tiff") and banded.endswith(".tiff")
+    with Image.open(in_memory) as a, Image.open(banded) as b:
+        assert_same_pixels(a.convert("RGB"), b.convert("RGB"))
+    with Image.open(preview) as img:
+        assert img.mode == "RGB"
+
+
+@pytest.mark.parametrize("banded", [False, True])
+def test_cmyk_watermark_text_is_k_only(layout, photos, tmp_path, banded):
+    branding = {"text": "Test shop"}
+    path, _, status, encoding = render_to_file(
+        layout, photos, str(tmp_path), "cmyk", cmyk=True, branding=branding, banded=banded
+    )
+    encoding.result()
+    assert "Watermark text" in status
+    _, text_mask, (x, y), _ = branding_layers(layout, **branding)
+    with Image.open(path) as tiff:
+        text = np.asarray(tiff.crop((x, y, x + text_mask.width, y + text_mask.height)))
+    inked = np.asarray(text_mask) > 0
+    assert inked.any()
+    assert (text[inked][:, :3] == 0).all()
+    assert (text[np.asarray(text_mask) == 255][:, 3] == 255).all()
+
+
+def test_in_memory_cmyk_preview_is_downsampled(layout, photos, tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, "PREVIEW_MAX_SIDE", 64)
+    _, preview, _, encoding = render_to_file(
+        layout, photos, str(tmp_path), "cmyk", cmyk=True, banded=False
+    )
+    encoding.result()
+    with Image.open(preview) as img:
+        assert img.mode == "RGB" and max(img.size) == 64
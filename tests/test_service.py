@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from collage.service import CollageService, QueueFull, _safe_name, make_server
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = CollageService(str(tmp_path / "data"), workers=1, max_queue=1)
+    yield service
+    service.shutdown()
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("photo 1.jpg", "photo_1.jpg"),
+        ("../../escaped", "escaped"),
+        ("/tmp/abs", "abs"),
+        ("..", ""),
+        (".hidden", "hidden"),
+        (None, ""),
+    ],
+)
+def test_safe_name(name, expected):
+    assert _safe_name(name) == expected
+
+
+# Regression: an absolute or ../ output_name wrote the files outside jobs/<id>
+@pytest.mark.parametrize("output_name", ["../../escaped", "/tmp/collage_escaped"])
+def test_output_stays_in_the_job_directory(service, photo_paths, output_name):
+    record = service.submit({"photos": photo_paths, "output_name": output_name})
+    record = service.status(record["id"], wait=60)
+    assert record["state"] == "done", record["error"]
+    name = os.path.basename(output_name)
+    assert record["files"] == [f"{name}.layout.json", f"{name}.png"]
+    job_dir = os.path.join(service.jobs_dir, record["id"])
+    assert os.path.dirname(record["result"]["output"]) == job_dir
+    assert not os.path.exists(os.path.join(os.path.dirname(service.data_dir), f"{name}.png"))
+
+
+def test_full_queue_turns_jobs_away(service, photo_paths):
+    rejected = 0
+    accepted = []
+    for _ in range(3):
+        try:
+            accepted.append(service.submit({"photos": photo_paths}))
+        except QueueFull:
+            rejected += 1
+    assert rejected >= 1
+    for record in accepted:
+        assert service.status(record["id"], wait=60)["state"] == "done"
+    stats = service.stats()
+    assert stats["rejected"] == rejected and stats["done"] == len(accepted)
+
+
+def test_http_upload_job_and_download(service, photo_paths):
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    def call(method, path, body=None):
+        request = urllib.request.Request(base + path, data=body, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as ex:
+            return ex.code, ex.read()
+
+    try:
+        uploads = []
+        for path in photo_paths:
+            with open(path, "rb") as f:
+                status, body = call("POST", "/uploads?name=" + os.path.basename(path), f.read())
+            assert status == 201
+            uploads.append(json.loads(body)["path"])
+        status, body = call("POST", "/jobs", json.dumps({"photos": uploads}).encode())
+        assert status == 202
+        job_id = json.loads(body)["id"]
+        status, body = call("GET", f"/jobs/{job_id}?wait=60")
+        record = json.loads(body)
+        assert record["state"] == "done", record["error"]
+        output = os.path.basename(record["result"]["output"])
+        status, body = call("GET", f"/jobs/{job_id}/files/{output}")
+        assert status == 200 and body.startswith(b"\x89PNG")
+        assert call("GET", f"/jobs/{job_id}/files/..%2F..%2Fuploads")[0] == 404
+        assert call("POST", "/jobs", b"{not json")[0] == 400
+        assert call("POST", "/jobs", json.dumps({"photos": []}).encode())[0] == 400
+        assert call("GET", "/jobs/unknown")[0] == 404
+        assert json.loads(call("GET", "/status")[1])["done"] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# Regression: an error outside the pool (here the job directory) killed the dispatcher
+def test_dispatcher_survives_a_job_it_cannot_set_up(service, photo_paths, monkeypatch):
+    makedirs = os.makedirs
+
+    def failing_makedirs(path, *args, **kwargs):
+        if os.path.dirname(path) == service.jobs_dir:
+            raise PermissionError(f"cannot create {path}")
+        return makedirs(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "makedirs", failing_makedirs)
+    record = service.status(service.submit({"photos": photo_paths})["id"], wait=60)
+    assert record["state"] == "failed" and "cannot create" in record["error"]
+    monkeypatch.setattr(os, "makedirs", makedirs)
+    record = service.status(service.submit({"photos": photo_paths})["id"], wait=60)
+    assert record["state"] == "done", record["error"]
@@ -0,0 +1,50 @@
+import pytest
+from PIL import Image, ImageChops
+
+from collage import StripTiffWriter
+
+
+def sample(mode, size=(70, 45)):
+    img = Image.linear_gradient("L").resize(size)
+    return Image.merge(mode, [img.rotate(90 * i).resize(size) for i in range(len(mode))])
+
+
+def write(path, image, band_height, **options):
+    with StripTiffWriter(path, image.width, image.height, image.mode, **options) as tiff:
+        for top in range(0, image.height, band_height):
+            tiff.write_band(image.crop((0, top, image.width, min(image.height, top + band_height))))
+    return tiff
+
+
+@pytest.mark.parametrize("mode", ["RGB", "CMYK"])
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"compression": "deflate"},
+        {"compression": None},
+        {"compression": "deflate", "tile_size": 16, "workers": 2},
+        {"compression": "deflate", "bigtiff": True},
+    ],
+)
+def test_written_tiff_reads_back_unchanged(tmp_path, mode, options):
+    image = sample(mode)
+    path = str(tmp_path / "out.tif")
+    tiff = write(path, image, options.get("tile_size") or 7, **options)
+    assert tiff.rows_written == image.height
+    with Image.open(path) as back:
+        back.load()
+        assert back.mode == mode and back.size == image.size
+        assert ImageChops.difference(back, image).getbbox() is None
+
+
+def test_icc_profile_is_embedded(tmp_path):
+    image = sample("RGB")
+    path = str(tmp_path / "icc.tif")
+    write(path, image, 16, icc_profile=b"not really a profile")
+    with Image.open(path) as back:
+        assert back.info.get("icc_profile") == b"not really a profile"
+
+
+def test_bad_tile_size_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        StripTiffWriter(str(tmp_path / "bad.tif"), 10, 10, tile_size=10)
@@ -0,0 +1,42 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from collage import RunTrace, current_trace, traced
+from collage.trace import submit_traced, trace_add
+
+
+def test_traced_without_a_trace_only_yields_counters():
+    assert current_trace() is None
+    with traced("search", photos=3) as counts:
+        counts["pack_attempts"] = 2
+    assert counts == {"photos": 3, "pack_attempts": 2}
+
+
+def test_stages_add_up_across_threads(tmp_path):
+    trace = RunTrace("job")
+
+    def resize():
+        with traced("resize", photos=1):
+            pass
+
+    with trace.activate():
+        with traced("search", photos=4, pack_attempts=2):
+            pass
+        with ThreadPoolExecutor(2) as pool:
+            for future in [submit_traced(pool, resize) for _ in range(3)]:
+                future.result()
+        trace_add("encode", 0.5)
+    trace.finish()
+    assert trace.stages["resize"]["calls"] == 3 and trace.stages["resize"]["photos"] == 3
+    assert trace.stages["encode"]["seconds"] == 0.5
+    assert "search" in trace.summary() and "2 packs, 4 photos" in trace.summary()
+    path = tmp_path / "job.trace.json"
+    trace.write(str(path))
+    assert json.loads(path.read_text())["stages"]["search"]["photos"] == 4
+
+
+def test_grid_column_counts_show_in_the_summary():
+    trace = RunTrace()
+    with trace.activate(), traced("search", photos=4, grid_columns=4):
+        pass
+    assert "4 column counts" in trace.summary()